@@ -18,7 +18,22 @@ To start the server:
     sourcemapr server
 """
 
-from sourcemapr.tracer import init_tracing, stop_tracing, get_tracer, get_langchain_handler
+from sourcemapr.tracer import (
+    init_tracing,
+    stop_tracing,
+    pause_tracing,
+    resume_tracing,
+    get_tracer,
+    get_langchain_handler,
+)
 
 __version__ = "0.1.1"
-__all__ = ["init_tracing", "stop_tracing", "get_tracer", "get_langchain_handler", "__version__"]
+__all__ = [
+    "init_tracing",
+    "stop_tracing",
+    "pause_tracing",
+    "resume_tracing",
+    "get_tracer",
+    "get_langchain_handler",
+    "__version__",
+]
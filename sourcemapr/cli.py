@@ -310,6 +310,11 @@ def cmd_init(reset: bool = False):
                 print("Cancelled")
                 return
             db.DB_PATH.unlink()
+            # Remove WAL side files so they are not replayed into the new database
+            for suffix in ('-wal', '-shm'):
+                side_file = db.DB_PATH.with_name(db.DB_PATH.name + suffix)
+                if side_file.exists():
+                    side_file.unlink()
             print("Existing database deleted")
 
     print(f"Initializing database at {db.DB_PATH}...")
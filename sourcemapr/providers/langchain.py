@@ -10,24 +10,50 @@ Instruments LangChain components:
 
 import time
 import os
+import asyncio
+import re
+import importlib.abc
+import sys
+import functools
+import hashlib
 import threading
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
 from typing import Optional, Dict, Any, List
-from uuid import UUID
+from uuid import UUID, uuid4
 
 from sourcemapr.providers.base import BaseProvider
-from sourcemapr.store import TraceStore
+from sourcemapr.store import TraceStore, _DEBUG
+from sourcemapr.utils.html_parser import HTML_EXTENSIONS, HTMLParser, build_page_lookup, scale_page_positions
+from sourcemapr.utils.html_text_extractor import HTMLChunkLocator
 
 
-# Thread-local flag to skip callback logging when inside a patched pipeline retriever
+# Flag to skip callback logging when inside a patched pipeline retriever
+_pipeline_active: ContextVar[bool] = ContextVar('sourcemapr_pipeline_active', default=False)
+
+# Retrievers patched below log their own pipeline, so their callbacks are skipped.
+# Exact names hit the frozenset; the regex covers names embedded in tags/ids.
+_PATCHED_RETRIEVERS = frozenset({'ContextualCompressionRetriever', 'MultiQueryRetriever', 'EnsembleRetriever'})
+_PATCHED_RETRIEVER_RE = re.compile('|'.join(sorted(_PATCHED_RETRIEVERS)))
+
+# Known LangChain reranking compressors; other names fall back to a substring check
+_RERANKER_CLASS_NAMES = frozenset({
+    'CohereRerank', 'CrossEncoderReranker', 'FlashrankRerank', 'JinaRerank',
+    'RankLLMRerank', 'VoyageAIRerank', 'LLMListwiseRerank', 'NVIDIARerank',
+    'BgeRerank', 'VolcengineRerank', 'DashScopeRerank', 'OpenVINOReranker',
+})
+
+def _is_reranker(compressor_name: str) -> bool:
+    """Check whether a compressor class name denotes a reranker."""
+    return compressor_name in _RERANKER_CLASS_NAMES or 'rerank' in compressor_name.lower()
+
+# Thread-local set of queries already logged by a patched pipeline retriever
 _pipeline_context = threading.local()
 
 def _in_pipeline_retriever():
     """Check if we're currently inside a patched pipeline retriever."""
-    return getattr(_pipeline_context, 'active', False)
-
-def _set_pipeline_context(active: bool):
-    """Set whether we're inside a patched pipeline retriever."""
-    _pipeline_context.active = active
+    return _pipeline_active.get()
 
 def _get_pending_pipeline_queries():
     """Get set of queries that have pending pipeline results (skip callback logging for these)."""
@@ -35,17 +61,247 @@ def _get_pending_pipeline_queries():
         _pipeline_context.pending_queries = set()
     return _pipeline_context.pending_queries
 
+# Recursion guard for the patched BaseLoader.load (loaders often call super().load()).
+# A ContextVar is a single C-level lookup and is correctly scoped per asyncio task.
+_in_load: ContextVar[bool] = ContextVar('sourcemapr_in_load', default=False)
+
+
+@functools.lru_cache(maxsize=4096)
+def _doc_id_from_source(source: str) -> str:
+    """Document id (file basename) for a retrieved chunk's source path."""
+    return os.path.basename(source) if source != 'unknown' else 'unknown'
+
+
+def _content_chunk_id(source: str, text: str) -> str:
+    """Fallback chunk id for documents without one: source plus a content digest.
+
+    A 64-bit blake2b digest is stable across processes (unlike the salted
+    built-in hash()) and wide enough that distinct chunks don't collide.
+    """
+    digest = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).hexdigest()
+    return f"{source}_{digest}"
+
+
+def _text_preview(doc, previews: Dict[int, str]) -> str:
+    """First 500 characters of a document's text, sliced once per document."""
+    key = id(doc)
+    text = previews.get(key)
+    if text is None:
+        text = previews[key] = doc.page_content[:500] if hasattr(doc, 'page_content') else ''
+    return text
+
+
+def _retrieved_chunk_id(doc, chunk_ids: Dict[int, str]) -> str:
+    """A retrieved document's chunk id, worked out once per document.
+
+    The content digest is only computed when the metadata has no chunk_id.
+    """
+    key = id(doc)
+    chunk_id = chunk_ids.get(key)
+    if chunk_id is None:
+        metadata = doc.metadata or {}
+        if 'chunk_id' in metadata:
+            chunk_id = metadata['chunk_id']
+        else:
+            chunk_id = _content_chunk_id(metadata.get('source', 'unknown'), doc.page_content)
+        chunk_ids[key] = chunk_id
+    return chunk_id
+
+
+# XBRL patterns (URLs, namespace prefixes, Member suffixes), lower-cased once
+_XBRL_INDICATORS = tuple(ind.lower() for ind in (
+    'http://', 'https://', 'us-gaap:', 'tsla:', 'srt:', 'Member', 'xbrli:', 'xbrldi:',
+))
+
+# First whitespace-delimited word longer than 50 characters (same whitespace as str.split)
+_LONG_FIRST_WORD_RE = re.compile(r'\s*\S{51}')
+
+
+def _is_visible_chunk(text: str) -> bool:
+    """Check if chunk text is visible content (not XBRL/metadata)."""
+    if not text or len(text) < 20:
+        return False
+    text_lower = text.lower()
+    xbrl_count = sum(1 for ind in _XBRL_INDICATORS if ind in text_lower)
+    # If more than 2 XBRL indicators, likely metadata
+    if xbrl_count > 2:
+        return False
+    # Check if mostly alphanumeric soup (namespace URIs)
+    if _LONG_FIRST_WORD_RE.match(text):  # Very long first "word" is likely a URI
+        return False
+    return True
+
+
+# Shared pool for fanning out the sub-retrievals of MultiQuery/Ensemble retrievers.
+# Created on first use; workers are recognised by name so nested pipelines run
+# serially instead of waiting on a pool they already occupy.
+_RETRIEVAL_POOL_PREFIX = 'sourcemapr-retrieval'
+_retrieval_pool: Optional[ThreadPoolExecutor] = None
+_retrieval_pool_lock = threading.Lock()
+
+
+def _map_retrievals(fn, items):
+    """Call fn on each item concurrently, returning results in item order."""
+    items = list(items)
+    if len(items) <= 1 or threading.current_thread().name.startswith(_RETRIEVAL_POOL_PREFIX):
+        return [fn(item) for item in items]
+    global _retrieval_pool
+    if _retrieval_pool is None:
+        with _retrieval_pool_lock:
+            if _retrieval_pool is None:
+                _retrieval_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix=_RETRIEVAL_POOL_PREFIX)
+    # Each call runs in a copy of the caller's context so pipeline flags carry over
+    futures = [_retrieval_pool.submit(copy_context().run, fn, item) for item in items]
+    return [future.result() for future in futures]
+
+
+# Loaders patched explicitly (BaseLoader.load catches the rest). Each is patched
+# when its own submodule is imported, so loaders the user never imports (and the
+# heavy langchain_community.document_loaders namespace) are never loaded by us.
+_LOADER_PATCH_TARGETS = (
+    ('langchain_community.document_loaders.pdf', 'PyPDFLoader', ('load', 'lazy_load')),
+    ('langchain_community.document_loaders.directory', 'DirectoryLoader', ('load',)),
+    ('langchain_community.document_loaders.text', 'TextLoader', ('load',)),
+    ('langchain_community.document_loaders.unstructured', 'UnstructuredFileLoader', ('load',)),
+)
+
+
+def _run_import_hook(module_name: str, callback):
+    """Run a post-import patch, never letting it break the user's import."""
+    try:
+        callback()
+    except Exception as e:
+        print(f"[SourcemapR] Warning: Could not patch {module_name}: {e}")
+
+
+class _HookedLoader(importlib.abc.Loader):
+    """Wraps a module's real loader to run patch callbacks once it has executed."""
+
+    def __init__(self, loader, hooks: '_PostImportHooks', module_name: str, callbacks: List):
+        self._loader = loader
+        self._hooks = hooks
+        self._module_name = module_name
+        self._callbacks = callbacks
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # The module only ever sees its real loader
+        module.__loader__ = self._loader
+        if getattr(module, '__spec__', None) is not None:
+            module.__spec__.loader = self._loader
+        try:
+            self._loader.exec_module(module)
+        except BaseException:
+            # Failed imports can be retried; keep the callbacks for that
+            self._hooks.register_pending(self._module_name, self._callbacks)
+            raise
+        for callback in self._callbacks:
+            _run_import_hook(self._module_name, callback)
+
+
+class _PostImportHooks(importlib.abc.MetaPathFinder):
+    """Apply patches when their LangChain module is first imported.
+
+    instrument() registers one callback per target module instead of
+    importing every loader, splitter and retriever module up front; modules
+    that are already imported are patched immediately.
+    """
+
+    def __init__(self):
+        self._callbacks: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def register(self, module_name: str, callback):
+        if module_name in sys.modules:
+            _run_import_hook(module_name, callback)
+        else:
+            self.register_pending(module_name, [callback])
+
+    def register_pending(self, module_name: str, callbacks: List):
+        with self._lock:
+            self._callbacks.setdefault(module_name, []).extend(callbacks)
+
+    def clear(self):
+        with self._lock:
+            self._callbacks.clear()
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in self._callbacks:
+            return None
+        # Let the real finders locate the module, then wrap its loader. Other
+        # hook finders (one per instrumented provider) are skipped, or each
+        # would ask the other forever; their callbacks run with ours instead.
+        for finder in sys.meta_path:
+            if isinstance(finder, _PostImportHooks) or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is None or not hasattr(spec.loader, 'exec_module'):
+            return spec
+        callbacks = []
+        for hooks in [self] + [f for f in sys.meta_path
+                               if isinstance(f, _PostImportHooks) and f is not self]:
+            callbacks.extend(hooks._pop_callbacks(fullname))
+        if callbacks:
+            spec.loader = _HookedLoader(spec.loader, self, fullname, callbacks)
+        return spec
+
+    def _pop_callbacks(self, module_name: str) -> List:
+        with self._lock:
+            return self._callbacks.pop(module_name, [])
+
+
+class _LLMSpan:
+    """In-flight LLM call state, keyed by run_id in the callback handler."""
+
+    __slots__ = ('start_time', 'model', 'prompts', 'messages', 'serialized')
+
+    def __init__(self, start_time: float, model: str, prompts: List[str] = (),
+                 messages: List[Dict] = (), serialized: Optional[Dict] = None):
+        self.start_time = start_time
+        self.model = model
+        self.prompts = prompts
+        self.messages = messages
+        self.serialized = serialized
+
+
+def _model_name(serialized: Optional[Dict[str, Any]]) -> str:
+    """Model name from a serialized LLM: its name, else the last id segment."""
+    if not serialized:
+        return 'unknown'
+    name = serialized.get('name')
+    if name:
+        return name
+    ids = serialized.get('id')
+    return ids[-1] if ids else 'unknown'
+
+
+def _join_prompts(prompts) -> str:
+    """Join prompts with newlines, returning a single prompt as-is (no copy)."""
+    if not prompts:
+        return ""
+    if len(prompts) == 1:
+        return prompts[0]
+    return "\n".join(prompts)
+
 
 # ============================================================================
 # CALLBACK HANDLER
 # ============================================================================
 
-def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
+def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False,
+                             skip_retriever_logging: bool = False):
     """Create LangChain callback handler.
 
     Args:
         store: TraceStore instance
         skip_llm_logging: If True, skip LLM call logging (use when OpenAI provider is also active)
+        skip_retriever_logging: If True, skip retrieval logging (use when retrievals are logged elsewhere)
     """
     from langchain_core.callbacks import BaseCallbackHandler
     from langchain_core.outputs import LLMResult
@@ -56,9 +312,10 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
         def __init__(self):
             super().__init__()
             self.store = store
-            self._llm_starts: Dict[str, Dict] = {}
-            self._retriever_starts: Dict[str, Dict] = {}
+            self._llm_starts: Dict[UUID, _LLMSpan] = {}
+            self._retriever_starts: Dict[UUID, Dict] = {}
             self._skip_llm_logging = skip_llm_logging
+            self._skip_retriever_logging = skip_retriever_logging
         
         @property
         def always_verbose(self) -> bool:
@@ -74,16 +331,14 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
             **kwargs: Any,
         ) -> None:
             """Called when LLM starts."""
-            if self._skip_llm_logging:
+            if self._skip_llm_logging or not self.store.enabled:
                 return
-            model = serialized.get('name', serialized.get('id', ['unknown'])[-1])
-            self._llm_starts[str(run_id)] = {
-                "start_time": time.time(),
-                "model": model,
-                "prompts": prompts,
-                "serialized": serialized,
-            }
-            print(f"[SourcemapR] LLM call started: {model}")
+            model = _model_name(serialized)
+            self._llm_starts[run_id] = _LLMSpan(
+                time.time(), model, prompts=prompts, serialized=serialized
+            )
+            if _DEBUG:
+                print(f"[SourcemapR] LLM call started: {model}")
 
         def on_llm_end(
             self,
@@ -94,41 +349,37 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
             **kwargs: Any,
         ) -> None:
             """Called when LLM finishes."""
-            if self._skip_llm_logging:
+            if self._skip_llm_logging or not self.store.enabled:
                 return
-            run_id_str = str(run_id)
-            llm_data = self._llm_starts.pop(run_id_str, {
-                "start_time": time.time(),
-                "model": "unknown",
-                "prompts": [],
-            })
-            duration_ms = (time.time() - llm_data["start_time"]) * 1000
+            llm_span = self._llm_starts.pop(run_id, None) or _LLMSpan(time.time(), "unknown")
+            duration_ms = (time.time() - llm_span.start_time) * 1000
 
             response_text = ""
             if response.generations and response.generations[0]:
                 response_text = response.generations[0][0].text
 
-            # Extract token usage
-            prompt_tokens = None
-            completion_tokens = None
-            total_tokens = None
-            if hasattr(response, 'llm_output') and response.llm_output:
-                usage = response.llm_output.get('token_usage', {})
-                prompt_tokens = usage.get('prompt_tokens')
-                completion_tokens = usage.get('completion_tokens')
-                total_tokens = usage.get('total_tokens')
+            # Extract token usage (most providers leave llm_output unset)
+            prompt_tokens = completion_tokens = total_tokens = None
+            llm_output = getattr(response, 'llm_output', None)
+            if llm_output:
+                usage = llm_output.get('token_usage')
+                if usage:
+                    prompt_tokens = usage.get('prompt_tokens')
+                    completion_tokens = usage.get('completion_tokens')
+                    total_tokens = usage.get('total_tokens')
 
             self.store.log_llm(
-                model=llm_data.get("model", "unknown"),
+                model=llm_span.model,
                 duration_ms=duration_ms,
-                prompt="\n".join(llm_data.get("prompts", [])),
+                prompt=_join_prompts(llm_span.prompts),
                 response=response_text,
                 prompt_tokens=prompt_tokens,
                 completion_tokens=completion_tokens,
                 total_tokens=total_tokens,
                 provider="langchain"
             )
-            print(f"[SourcemapR] LLM call logged: {llm_data.get('model', 'unknown')} ({duration_ms:.0f}ms)")
+            if _DEBUG:
+                print(f"[SourcemapR] LLM call logged: {llm_span.model} ({duration_ms:.0f}ms)")
 
         def on_llm_error(
             self,
@@ -139,19 +390,15 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
             **kwargs: Any,
         ) -> None:
             """Called when LLM errors."""
-            if self._skip_llm_logging:
+            if self._skip_llm_logging or not self.store.enabled:
                 return
-            run_id_str = str(run_id)
-            llm_data = self._llm_starts.pop(run_id_str, {
-                "start_time": time.time(),
-                "model": "unknown",
-            })
-            duration_ms = (time.time() - llm_data["start_time"]) * 1000
+            llm_span = self._llm_starts.pop(run_id, None) or _LLMSpan(time.time(), "unknown")
+            duration_ms = (time.time() - llm_span.start_time) * 1000
 
             self.store.log_llm(
-                model=llm_data.get("model", "unknown"),
+                model=llm_span.model,
                 duration_ms=duration_ms,
-                prompt="\n".join(llm_data.get("prompts", [])),
+                prompt=_join_prompts(llm_span.prompts),
                 error=str(error),
                 provider="langchain"
             )
@@ -166,9 +413,9 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
             **kwargs: Any,
         ) -> None:
             """Called when chat model starts."""
-            if self._skip_llm_logging:
+            if self._skip_llm_logging or not self.store.enabled:
                 return
-            model = serialized.get('name', serialized.get('id', ['unknown'])[-1])
+            model = _model_name(serialized)
 
             # Format messages
             formatted_messages = []
@@ -180,13 +427,11 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
                             'content': msg.content
                         })
 
-            self._llm_starts[str(run_id)] = {
-                "start_time": time.time(),
-                "model": model,
-                "messages": formatted_messages,
-                "serialized": serialized,
-            }
-            print(f"[SourcemapR] Chat model started: {model}")
+            self._llm_starts[run_id] = _LLMSpan(
+                time.time(), model, messages=formatted_messages, serialized=serialized
+            )
+            if _DEBUG:
+                print(f"[SourcemapR] Chat model started: {model}")
 
         def on_retriever_start(
             self,
@@ -198,26 +443,29 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
             **kwargs: Any,
         ) -> None:
             """Called when retrieval starts."""
+            if self._skip_retriever_logging or not self.store.enabled:
+                return
             # Skip if inside a patched pipeline retriever (it handles its own logging)
             if _in_pipeline_retriever():
-                self._retriever_starts[str(run_id)] = {'skip': True}
+                self._retriever_starts[run_id] = {'skip': True}
                 return
             # Skip patched pipeline retrievers (they handle their own logging)
-            patched_retrievers = ['ContextualCompressionRetriever', 'MultiQueryRetriever', 'EnsembleRetriever']
             retriever_name = ''
             if serialized:
                 retriever_name = serialized.get('name', serialized.get('id', [''])[-1] if serialized.get('id') else '')
             # Also check kwargs for retriever class name
             if not retriever_name and 'tags' in kwargs:
                 retriever_name = str(kwargs.get('tags', []))
-            if any(r in str(retriever_name) for r in patched_retrievers):
-                self._retriever_starts[str(run_id)] = {'skip': True}
+            retriever_name = str(retriever_name)
+            if retriever_name in _PATCHED_RETRIEVERS or _PATCHED_RETRIEVER_RE.search(retriever_name):
+                self._retriever_starts[run_id] = {'skip': True}
                 return
-            self._retriever_starts[str(run_id)] = {
+            self._retriever_starts[run_id] = {
                 "start_time": time.time(),
                 "query": query,
             }
-            print(f"[SourcemapR] Retrieval started: {query[:50]}...")
+            if _DEBUG:
+                print(f"[SourcemapR] Retrieval started: {query[:50]}...")
 
         def on_retriever_end(
             self,
@@ -228,11 +476,16 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
             **kwargs: Any,
         ) -> None:
             """Called when retrieval finishes."""
+            if self._skip_retriever_logging or not self.store.enabled:
+                return
             # Skip if inside a patched pipeline retriever (it handles its own logging)
             if _in_pipeline_retriever():
                 return
-            run_id_str = str(run_id)
-            retriever_data = self._retriever_starts.pop(run_id_str, {
+            # Nothing to log for empty results
+            if not documents:
+                self._retriever_starts.pop(run_id, None)
+                return
+            retriever_data = self._retriever_starts.pop(run_id, {
                 "start_time": time.time(),
                 "query": "",
             })
@@ -248,23 +501,26 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
 
             results = []
             for i, doc in enumerate(documents):
-                metadata = getattr(doc, 'metadata', {})
-                source = metadata.get('source', metadata.get('file_path', ''))
+                metadata = getattr(doc, 'metadata', None) or {}
+                md_get = metadata.get
+                # Only evaluate fallbacks when the primary key is missing
+                source = md_get('source') if 'source' in metadata else md_get('file_path', '')
                 abs_path = os.path.abspath(source) if source else ''
                 filename = os.path.basename(source) if source else ''
+                page_content = getattr(doc, 'page_content', None)
 
                 # Extract character indices if available
-                start_char_idx = metadata.get('start_index')
+                start_char_idx = md_get('start_index')
                 end_char_idx = None
-                if start_char_idx is not None and hasattr(doc, 'page_content'):
-                    end_char_idx = start_char_idx + len(doc.page_content)
+                if start_char_idx is not None and page_content is not None:
+                    end_char_idx = start_char_idx + len(page_content)
 
                 result_data = {
-                    "chunk_id": metadata.get('chunk_id', f"{filename}_{i}"),
-                    "score": metadata.get('score', 0),
-                    "text": doc.page_content[:500] if hasattr(doc, 'page_content') else str(doc)[:500],
+                    "chunk_id": md_get('chunk_id') if 'chunk_id' in metadata else f"{filename}_{i}",
+                    "score": md_get('score', 0),
+                    "text": page_content[:500] if page_content is not None else str(doc)[:500],
                     "doc_id": filename,
-                    "page_number": metadata.get('page', metadata.get('page_label')),
+                    "page_number": md_get('page') if 'page' in metadata else md_get('page_label'),
                     "file_path": abs_path,
                 }
 
@@ -280,7 +536,8 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
                 results=results,
                 duration_ms=duration_ms,
             )
-            print(f"[SourcemapR] Retrieval completed: {len(documents)} documents")
+            if _DEBUG:
+                print(f"[SourcemapR] Retrieval completed: {len(documents)} documents")
 
         def on_retriever_error(
             self,
@@ -291,9 +548,11 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
             **kwargs: Any,
         ) -> None:
             """Called when retrieval errors."""
+            if self._skip_retriever_logging or not self.store.enabled:
+                return
             if _in_pipeline_retriever():
                 return
-            self._retriever_starts.pop(str(run_id), None)
+            self._retriever_starts.pop(run_id, None)
 
     return SourcemapRLangChainHandler()
 
@@ -305,19 +564,47 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
 class DocumentLoaderPatcher:
     """Helper class for patching document loaders."""
 
-    # Class variable to store HTML page positions for later use in chunk page detection
-    _html_page_positions: Dict[str, Dict] = {}
-    # Store raw HTML content for position mapping during chunk creation
-    _raw_html_content: Dict[str, str] = {}
-    # Store loader text for position mapping
-    _loader_text: Dict[str, str] = {}
+    # HTML state is only needed until the document is split, so keep just
+    # the most recently loaded files
+    _html_cache_size = 16
 
     def __init__(self, store: TraceStore, register_framework, original_handlers: Dict):
         self.store = store
         self.register_framework = register_framework
         self.original_handlers = original_handlers
         self.logged_sources = set()
-        self._loading_lock = threading.local()
+        # HTML page positions for later use in chunk page detection
+        self._html_page_positions: Dict[str, Dict] = OrderedDict()
+        # Raw HTML content for position mapping during chunk creation
+        self._raw_html_content: Dict[str, str] = OrderedDict()
+        # Loader text for position mapping
+        self._loader_text: Dict[str, str] = OrderedDict()
+        # Chunk locators over the raw HTML, reused when a document is split again
+        self._html_locators: Dict[str, HTMLChunkLocator] = OrderedDict()
+
+    def _remember(self, cache: Dict, filename: str, value):
+        """Store a per-file value, evicting the oldest entries over the cap."""
+        cache[filename] = value
+        cache.move_to_end(filename)
+        while len(cache) > self._html_cache_size:
+            cache.popitem(last=False)
+
+    def html_locator(self, filename: str) -> HTMLChunkLocator:
+        """Locator for a file's raw HTML, rebuilt only when the HTML changes."""
+        raw_html = self._raw_html_content[filename]
+        locator = self._html_locators.get(filename)
+        if locator is None or locator.html_content is not raw_html:
+            locator = HTMLChunkLocator(raw_html)
+            self._remember(self._html_locators, filename, locator)
+        return locator
+
+    def clear(self):
+        """Drop all cached HTML state and the record of logged sources."""
+        self._html_page_positions.clear()
+        self._raw_html_content.clear()
+        self._loader_text.clear()
+        self._html_locators.clear()
+        self.logged_sources.clear()
 
     def log_documents(self, result, loader_name="unknown"):
         """Log documents from loader results."""
@@ -325,29 +612,33 @@ class DocumentLoaderPatcher:
             return
         self.register_framework()
 
+        # Group only sources not seen before, so re-running a loader over the
+        # same files costs one membership test per document and nothing more.
+        logged_sources = self.logged_sources
         docs_by_source = {}
         for doc in result:
             source = doc.metadata.get('source', 'unknown')
-            if source not in docs_by_source:
-                docs_by_source[source] = []
-            docs_by_source[source].append(doc)
+            if source in logged_sources:
+                continue
+            group = docs_by_source.get(source)
+            if group is None:
+                docs_by_source[source] = group = []
+            group.append(doc)
+
+        if not docs_by_source:
+            return
 
         for source, docs in docs_by_source.items():
-            if source in self.logged_sources:
-                continue
-            self.logged_sources.add(source)
+            logged_sources.add(source)
 
             abs_path = os.path.abspath(source) if source != 'unknown' else source
             filename = os.path.basename(source) if source != 'unknown' else 'unknown'
 
             # Check if this is an HTML file
-            file_ext = abs_path.lower().split('.')[-1] if abs_path != 'unknown' else ''
-            if file_ext in ('htm', 'html', 'xhtml'):
+            if abs_path.lower().endswith(HTML_EXTENSIONS):
                 # For HTML: Use loader's text directly (so chunk indices match for highlighting)
                 # But also parse HTML to get page positions for page number detection
                 try:
-                    from sourcemapr.utils.html_parser import HTMLParser
-
                     # Get the loader's extracted text (what text splitter will see)
                     loader_text = "\n\n".join([d.page_content for d in docs])
 
@@ -356,8 +647,8 @@ class DocumentLoaderPatcher:
                         html_content = f.read()
 
                     # Store raw HTML for position mapping during chunk creation
-                    DocumentLoaderPatcher._raw_html_content[filename] = html_content
-                    DocumentLoaderPatcher._loader_text[filename] = loader_text
+                    self._remember(self._raw_html_content, filename, html_content)
+                    self._remember(self._loader_text, filename, loader_text)
 
                     parser = HTMLParser(html_content, filename)
                     page_count = parser.page_count
@@ -370,16 +661,9 @@ class DocumentLoaderPatcher:
                     loader_text_len = len(loader_text)
 
                     # Scale page positions from HTML parser to loader text positions
-                    if html_text_len > 0:
-                        scale = loader_text_len / html_text_len
-                        scaled_positions = {}
-                        for page_num, (start, end) in parser.page_positions.items():
-                            scaled_start = int(start * scale)
-                            scaled_end = int(end * scale)
-                            scaled_positions[page_num] = (scaled_start, scaled_end)
-                        DocumentLoaderPatcher._html_page_positions[filename] = scaled_positions
-                    else:
-                        DocumentLoaderPatcher._html_page_positions[filename] = {1: (0, loader_text_len)}
+                    self._remember(self._html_page_positions, filename, scale_page_positions(
+                        parser.page_positions, html_text_len, loader_text_len
+                    ))
 
                     self.store.log_document(
                         doc_id=filename,
@@ -396,7 +680,8 @@ class DocumentLoaderPatcher:
                         text=loader_text
                     )
 
-                    print(f"[SourcemapR] Document loaded (HTML): {filename} ({page_count} pages, {len(loader_text):,} chars)")
+                    if _DEBUG:
+                        print(f"[SourcemapR] Document loaded (HTML): {filename} ({page_count} pages, {len(loader_text):,} chars)")
                     continue
 
                 except Exception as e:
@@ -404,6 +689,8 @@ class DocumentLoaderPatcher:
                     # Fall through to default handling
 
             # Default handling for non-HTML files (PDF, etc.)
+            # str.join sizes the result up front and copies each page once; an
+            # io.StringIO write loop measured the same peak memory and no faster.
             full_text = "\n\n--- PAGE BREAK ---\n\n".join([d.page_content for d in docs])
 
             self.store.log_document(
@@ -419,7 +706,8 @@ class DocumentLoaderPatcher:
                 filename=filename,
                 text=full_text
             )
-            print(f"[SourcemapR] Document loaded: {filename} ({len(docs)} pages, path: {abs_path})")
+            if _DEBUG:
+                print(f"[SourcemapR] Document loaded: {filename} ({len(docs)} pages, path: {abs_path})")
     
     def patch_loader(self, loader_class, method_name: str = "load"):
         """Patch a document loader class."""
@@ -428,13 +716,15 @@ class DocumentLoaderPatcher:
             
             def patched(self_loader, *args, **kwargs):
                 result = original(self_loader, *args, **kwargs)
+                if not self.store.enabled:
+                    return result
                 loader_name = self_loader.__class__.__name__
                 self.log_documents(result, loader_name)
                 return result
             
             setattr(loader_class, method_name, patched)
             key = f"{loader_class.__name__}.{method_name}"
-            self.original_handlers[key] = original
+            self.original_handlers[key] = (loader_class, method_name, original)
             return True
         except (ImportError, AttributeError):
             return False
@@ -447,6 +737,9 @@ class DocumentLoaderPatcher:
             original = getattr(loader_class, method_name)
             
             def patched(self_loader, *args, **kwargs):
+                if not self.store.enabled:
+                    yield from original(self_loader, *args, **kwargs)
+                    return
                 result = list(original(self_loader, *args, **kwargs))
                 loader_name = self_loader.__class__.__name__
                 self.log_documents(result, loader_name)
@@ -455,7 +748,7 @@ class DocumentLoaderPatcher:
             
             setattr(loader_class, method_name, patched)
             key = f"{loader_class.__name__}.{method_name}"
-            self.original_handlers[key] = original
+            self.original_handlers[key] = (loader_class, method_name, original)
             return True
         except (ImportError, AttributeError):
             return False
@@ -472,23 +765,21 @@ class DocumentLoaderPatcher:
             
             def patched(self_loader, *args, **kwargs):
                 # Prevent recursion
-                if not hasattr(self._loading_lock, 'active'):
-                    self._loading_lock.active = False
-                if self._loading_lock.active:
+                if _in_load.get() or not self.store.enabled:
                     return original(self_loader, *args, **kwargs)
-                
-                self._loading_lock.active = True
+
+                token = _in_load.set(True)
                 try:
                     result = original(self_loader, *args, **kwargs)
                     loader_name = self_loader.__class__.__name__
                     self.log_documents(result, loader_name)
                     return result
                 finally:
-                    self._loading_lock.active = False
+                    _in_load.reset(token)
             
             patched._sourcemapr_patched = True
             BaseLoader.load = patched
-            self.original_handlers['BaseLoader.load'] = original
+            self.original_handlers['BaseLoader.load'] = (BaseLoader, 'load', original)
             print("[SourcemapR] Patched BaseLoader (all document loaders)")
             return True
         except ImportError:
@@ -504,9 +795,12 @@ class LangChainProvider(BaseProvider):
     
     name = "langchain"
     
-    def __init__(self, store: TraceStore):
+    def __init__(self, store: TraceStore, skip_retriever_logging: bool = False):
         super().__init__(store)
         self._callback_handler = None
+        self._skip_retriever_logging = skip_retriever_logging
+        self._loader_patcher: Optional[DocumentLoaderPatcher] = None
+        self._import_hooks: Optional[_PostImportHooks] = None
     
     def is_available(self) -> bool:
         try:
@@ -525,17 +819,22 @@ class LangChainProvider(BaseProvider):
         
         try:
             self._setup_callbacks()
+            # Component patches are applied as their modules get imported
+            hooks = self._import_hooks = _PostImportHooks()
             self._patch_document_loaders()
-            self._patch_text_splitters()
-            self._patch_vector_store_retriever()
+            hooks.register('langchain_text_splitters.base', self._patch_text_splitters)
+            hooks.register('langchain_core.vectorstores', self._patch_vector_store_retriever)
             # Advanced retriever patches
-            self._patch_contextual_compression_retriever()
-            self._patch_multi_query_retriever()
-            self._patch_ensemble_retriever()
+            hooks.register('langchain.retrievers', self._patch_contextual_compression_retriever)
+            hooks.register('langchain.retrievers.multi_query', self._patch_multi_query_retriever)
+            hooks.register('langchain.retrievers', self._patch_ensemble_retriever)
+            # Only start intercepting imports once every registration succeeded
+            sys.meta_path.insert(0, hooks)
             self._instrumented = True
             print("[SourcemapR] LangChain provider enabled")
             return True
         except Exception as e:
+            self._import_hooks = None
             print(f"[SourcemapR] LangChain provider error: {e}")
             return False
     
@@ -551,7 +850,11 @@ class LangChainProvider(BaseProvider):
         """Set up LangChain callback handler."""
         # Skip LLM logging if OpenAI provider is available (to avoid duplicates)
         skip_llm = self._check_openai_available()
-        self._callback_handler = _create_callback_handler(self.store, skip_llm_logging=skip_llm)
+        self._callback_handler = _create_callback_handler(
+            self.store,
+            skip_llm_logging=skip_llm,
+            skip_retriever_logging=self._skip_retriever_logging
+        )
         if skip_llm:
             print("[SourcemapR] LangChain: Skipping LLM logging (OpenAI provider active)")
 
@@ -569,27 +872,33 @@ class LangChainProvider(BaseProvider):
     
     def _patch_document_loaders(self):
         """Patch document loaders to track document loading."""
-        patcher = DocumentLoaderPatcher(
+        patcher = self._loader_patcher = DocumentLoaderPatcher(
             self.store,
             self._register_framework,
             self._original_handlers
         )
         
         # Patch specific loaders
-        try:
-            from langchain_community.document_loaders import (
-                PyPDFLoader, DirectoryLoader, TextLoader, UnstructuredFileLoader
-            )
-            patcher.patch_loader(PyPDFLoader, "load")
-            patcher.patch_lazy_loader(PyPDFLoader, "lazy_load")
-            patcher.patch_loader(DirectoryLoader, "load")
-            patcher.patch_loader(TextLoader, "load")
-            patcher.patch_loader(UnstructuredFileLoader, "load")
-        except ImportError:
-            pass
+        for module_name, class_name, method_names in _LOADER_PATCH_TARGETS:
+            self._import_hooks.register(module_name, functools.partial(
+                self._patch_loader_class, patcher, module_name, class_name, method_names
+            ))
         
         # Patch base loader to catch all others (including HTML loaders)
-        patcher.patch_base_loader()
+        self._import_hooks.register('langchain_core.document_loaders', patcher.patch_base_loader)
+
+    @staticmethod
+    def _patch_loader_class(patcher: DocumentLoaderPatcher, module_name: str,
+                            class_name: str, method_names):
+        """Patch the given methods of a loader class from an imported module."""
+        loader_class = getattr(sys.modules.get(module_name), class_name, None)
+        if loader_class is None:
+            return
+        for method_name in method_names:
+            if method_name == "lazy_load":
+                patcher.patch_lazy_loader(loader_class, method_name)
+            else:
+                patcher.patch_loader(loader_class, method_name)
     
     def _patch_vector_store_retriever(self):
         """Patch VectorStoreRetriever to inject scores into document metadata."""
@@ -600,6 +909,17 @@ class LangChainProvider(BaseProvider):
                 return
 
             original_get_docs = VectorStoreRetriever._get_relevant_documents
+            original_aget_docs = VectorStoreRetriever._aget_relevant_documents
+
+            def with_scores(docs_and_scores):
+                """Inject scores into metadata."""
+                docs = []
+                for doc, score in docs_and_scores:
+                    if not doc.metadata:
+                        doc.metadata = {}
+                    doc.metadata['score'] = float(score)
+                    docs.append(doc)
+                return docs
 
             def patched_get_docs(self_retriever, query, *, run_manager=None):
                 # Try to get documents with scores
@@ -609,191 +929,261 @@ class LangChainProvider(BaseProvider):
                 try:
                     # Use similarity_search_with_score if available
                     if hasattr(vectorstore, 'similarity_search_with_score'):
-                        docs_and_scores = vectorstore.similarity_search_with_score(
+                        return with_scores(vectorstore.similarity_search_with_score(
                             query, k=k, **{kk: vv for kk, vv in self_retriever.search_kwargs.items() if kk != 'k'}
-                        )
-                        # Inject scores into metadata
-                        docs = []
-                        for doc, score in docs_and_scores:
-                            if not doc.metadata:
-                                doc.metadata = {}
-                            doc.metadata['score'] = float(score)
-                            docs.append(doc)
-                        return docs
+                        ))
                 except Exception:
                     pass
 
                 # Fallback to original method
                 return original_get_docs(self_retriever, query, run_manager=run_manager)
 
+            async def patched_aget_docs(self_retriever, query, *, run_manager=None):
+                vectorstore = self_retriever.vectorstore
+                k = self_retriever.search_kwargs.get('k', 4)
+
+                try:
+                    if hasattr(vectorstore, 'asimilarity_search_with_score'):
+                        return with_scores(await vectorstore.asimilarity_search_with_score(
+                            query, k=k, **{kk: vv for kk, vv in self_retriever.search_kwargs.items() if kk != 'k'}
+                        ))
+                except Exception:
+                    pass
+
+                return await original_aget_docs(self_retriever, query, run_manager=run_manager)
+
             patched_get_docs._sourcemapr_patched = True
+            patched_aget_docs._sourcemapr_patched = True
             VectorStoreRetriever._get_relevant_documents = patched_get_docs
-            self._original_handlers['VectorStoreRetriever._get_relevant_documents'] = original_get_docs
+            VectorStoreRetriever._aget_relevant_documents = patched_aget_docs
+            self._original_handlers['VectorStoreRetriever._get_relevant_documents'] = (
+                VectorStoreRetriever, '_get_relevant_documents', original_get_docs
+            )
+            self._original_handlers['VectorStoreRetriever._aget_relevant_documents'] = (
+                VectorStoreRetriever, '_aget_relevant_documents', original_aget_docs
+            )
             print("[SourcemapR] Patched VectorStoreRetriever (scores will be captured)")
         except ImportError:
             pass
 
+    def _flush_events(self, events: List[Dict]):
+        """Queue a pipeline's stage and pipeline events with a single put."""
+        if events:
+            self.store._enqueue({'type': 'batch', 'items': events})
+
     def _patch_contextual_compression_retriever(self):
         """Patch ContextualCompressionRetriever to track reranking/compression stages."""
         try:
             from langchain.retrievers import ContextualCompressionRetriever
-            import uuid
 
             if hasattr(ContextualCompressionRetriever._get_relevant_documents, '_sourcemapr_patched'):
                 return
 
             original_get_docs = ContextualCompressionRetriever._get_relevant_documents
-
-            def patched_get_docs(self_retriever, query, *, run_manager=None):
-                import time
-                start_time = time.time()
-                pipeline_id = str(uuid.uuid4())[:12]
+            original_aget_docs = ContextualCompressionRetriever._aget_relevant_documents
+
+            def record_pipeline(self_retriever, query, start_ns,
+                                base_docs, base_duration, compressed_docs, compress_duration):
+                """Log the stages, pipeline record and final results of one query."""
+                pipeline_id = uuid4().hex[:12]
+                # Stage, pipeline and retrieval events, queued together once the pipeline is known
+                events = []
+                # Text previews by id(doc); the same documents recur across stages
+                previews = {}
                 stage_order = 1
 
-                # Set context to skip callback logging (we handle it here)
-                _set_pipeline_context(True)
+                base_chunks = []
+                for i, doc in enumerate(base_docs):
+                    metadata = doc.metadata or {}
+                    source = metadata.get('source', 'unknown')
+                    base_chunks.append({
+                        'chunk_id': metadata.get('chunk_id', f"chunk_{i}"),
+                        'doc_id': _doc_id_from_source(source),
+                        'text': _text_preview(doc, previews),
+                        'input_rank': i + 1,
+                        'output_rank': i + 1,
+                        'input_score': metadata.get('score', 0),
+                        'output_score': metadata.get('score', 0),
+                        'source': 'base_retriever',
+                        'status': 'kept',
+                    })
 
-                try:
-                    # Stage 1: Base retrieval
-                    base_start = time.time()
-                    base_docs = self_retriever.base_retriever.get_relevant_documents(query)
-                    base_duration = (time.time() - base_start) * 1000
-
-                    base_chunks = []
-                    for i, doc in enumerate(base_docs):
-                        source = doc.metadata.get('source', 'unknown')
-                        base_chunks.append({
-                            'chunk_id': doc.metadata.get('chunk_id', f"chunk_{i}"),
-                            'doc_id': os.path.basename(source) if source != 'unknown' else 'unknown',
-                            'text': doc.page_content[:500],
-                            'input_rank': i + 1,
-                            'output_rank': i + 1,
-                            'input_score': doc.metadata.get('score', 0),
-                            'output_score': doc.metadata.get('score', 0),
-                            'source': 'base_retriever',
-                            'status': 'kept',
-                        })
+                # Log base retrieval stage
+                events.append({
+                    'type': 'pipeline_stage',
+                    'data': {
+                        'stage_id': f"{pipeline_id}_retrieval",
+                        'pipeline_id': pipeline_id,
+                        'stage_type': 'retrieval',
+                        'stage_name': self_retriever.base_retriever.__class__.__name__,
+                        'stage_order': stage_order,
+                        'input_count': 0,
+                        'output_count': len(base_docs),
+                        'duration_ms': base_duration,
+                        'metadata': {'query': query},
+                        'chunks': base_chunks,
+                    }
+                })
+                stage_order += 1
 
-                    # Log base retrieval stage
-                    self.store._send_queue.put({
-                        'type': 'pipeline_stage',
-                        'data': {
-                            'stage_id': f"{pipeline_id}_retrieval",
-                            'pipeline_id': pipeline_id,
-                            'stage_type': 'retrieval',
-                            'stage_name': self_retriever.base_retriever.__class__.__name__,
-                            'stage_order': stage_order,
-                            'input_count': 0,
-                            'output_count': len(base_docs),
-                            'duration_ms': base_duration,
-                            'metadata': {'query': query},
-                            'chunks': base_chunks,
-                        }
+                # First base chunk per id, for O(1) rank/score lookups
+                base_by_id = {}
+                for chunk in base_chunks:
+                    base_by_id.setdefault(chunk['chunk_id'], chunk)
+
+                # Track which chunks survived and their new scores/ranks
+                compressed_chunks = []
+                survived_ids = set()
+                for i, doc in enumerate(compressed_docs):
+                    metadata = doc.metadata or {}
+                    chunk_id = metadata.get('chunk_id', f"chunk_{i}")
+                    survived_ids.add(chunk_id)
+                    source = metadata.get('source', 'unknown')
+                    base_chunk = base_by_id.get(chunk_id)
+                    compressed_chunks.append({
+                        'chunk_id': chunk_id,
+                        'doc_id': _doc_id_from_source(source),
+                        'text': _text_preview(doc, previews),
+                        'input_rank': base_chunk['input_rank'] if base_chunk else None,
+                        'output_rank': i + 1,
+                        'input_score': base_chunk['input_score'] if base_chunk else 0,
+                        'output_score': metadata.get('relevance_score', metadata.get('score', 0)),
+                        'source': 'compressor',
+                        'status': 'kept',
                     })
-                    stage_order += 1
 
-                    # Stage 2: Compression/Reranking
-                    compress_start = time.time()
-                    compressed_docs = self_retriever.base_compressor.compress_documents(base_docs, query)
-                    compress_duration = (time.time() - compress_start) * 1000
-
-                    # Track which chunks survived and their new scores/ranks
-                    compressed_chunks = []
-                    survived_ids = set()
-                    for i, doc in enumerate(compressed_docs):
-                        chunk_id = doc.metadata.get('chunk_id', f"chunk_{i}")
-                        survived_ids.add(chunk_id)
-                        source = doc.metadata.get('source', 'unknown')
+                # Mark filtered chunks
+                for chunk in base_chunks:
+                    if chunk['chunk_id'] not in survived_ids:
                         compressed_chunks.append({
-                            'chunk_id': chunk_id,
-                            'doc_id': os.path.basename(source) if source != 'unknown' else 'unknown',
-                            'text': doc.page_content[:500],
-                            'input_rank': next((j+1 for j, c in enumerate(base_chunks) if c['chunk_id'] == chunk_id), None),
-                            'output_rank': i + 1,
-                            'input_score': next((c['input_score'] for c in base_chunks if c['chunk_id'] == chunk_id), 0),
-                            'output_score': doc.metadata.get('relevance_score', doc.metadata.get('score', 0)),
-                            'source': 'compressor',
-                            'status': 'kept',
+                            **chunk,
+                            'output_rank': None,
+                            'status': 'filtered',
                         })
 
-                    # Mark filtered chunks
-                    for chunk in base_chunks:
-                        if chunk['chunk_id'] not in survived_ids:
-                            compressed_chunks.append({
-                                **chunk,
-                                'output_rank': None,
-                                'status': 'filtered',
-                            })
-
-                    # Log compression stage
-                    compressor_name = self_retriever.base_compressor.__class__.__name__
-                    self.store._send_queue.put({
-                        'type': 'pipeline_stage',
-                        'data': {
-                            'stage_id': f"{pipeline_id}_compression",
-                            'pipeline_id': pipeline_id,
-                            'stage_type': 'reranking' if 'rerank' in compressor_name.lower() else 'compression',
-                            'stage_name': compressor_name,
-                            'stage_order': stage_order,
-                            'input_count': len(base_docs),
-                            'output_count': len(compressed_docs),
-                            'duration_ms': compress_duration,
-                            'metadata': {'compression_ratio': len(compressed_docs) / max(len(base_docs), 1)},
-                            'chunks': compressed_chunks,
-                        }
-                    })
+                # Log compression stage
+                compressor_name = self_retriever.base_compressor.__class__.__name__
+                events.append({
+                    'type': 'pipeline_stage',
+                    'data': {
+                        'stage_id': f"{pipeline_id}_compression",
+                        'pipeline_id': pipeline_id,
+                        'stage_type': 'reranking' if _is_reranker(compressor_name) else 'compression',
+                        'stage_name': compressor_name,
+                        'stage_order': stage_order,
+                        'input_count': len(base_docs),
+                        'output_count': len(compressed_docs),
+                        'duration_ms': compress_duration,
+                        'metadata': {'compression_ratio': len(compressed_docs) / max(len(base_docs), 1)},
+                        'chunks': compressed_chunks,
+                    }
+                })
 
-                    total_duration = (time.time() - start_time) * 1000
+                total_duration = (time.perf_counter_ns() - start_ns) / 1e6
 
-                    # Generate retrieval_id to link retrieval and pipeline
-                    retrieval_id = f"ret_{pipeline_id}"
+                # Generate retrieval_id to link retrieval and pipeline
+                retrieval_id = f"ret_{pipeline_id}"
 
-                    # Send pipeline record (links stages together and to retrieval)
-                    self.store._send_queue.put({
-                        'type': 'pipeline',
-                        'data': {
-                            'pipeline_id': pipeline_id,
-                            'query': query,
-                            'total_duration_ms': total_duration,
-                            'num_stages': stage_order,
-                            'retrieval_id': retrieval_id,
-                        }
-                    })
+                # Send pipeline record (links stages together and to retrieval)
+                events.append({
+                    'type': 'pipeline',
+                    'data': {
+                        'pipeline_id': pipeline_id,
+                        'query': query,
+                        'total_duration_ms': total_duration,
+                        'num_stages': stage_order,
+                        'retrieval_id': retrieval_id,
+                    }
+                })
 
-                    # Build final results for retrieval event
-                    final_results = []
-                    for i, doc in enumerate(compressed_docs):
-                        metadata = getattr(doc, 'metadata', {})
-                        source = metadata.get('source', 'unknown')
-                        final_results.append({
-                            'chunk_id': metadata.get('chunk_id', f"chunk_{i}"),
-                            'score': metadata.get('relevance_score', metadata.get('score', 0)),
-                            'text': doc.page_content[:500] if hasattr(doc, 'page_content') else '',
-                            'doc_id': os.path.basename(source) if source != 'unknown' else 'unknown',
-                            'page_number': metadata.get('page', metadata.get('page_label')),
-                        })
+                # Build final results for retrieval event
+                final_results = []
+                for i, doc in enumerate(compressed_docs):
+                    metadata = getattr(doc, 'metadata', {})
+                    source = metadata.get('source', 'unknown')
+                    final_results.append({
+                        'chunk_id': metadata.get('chunk_id', f"chunk_{i}"),
+                        'score': metadata.get('relevance_score', metadata.get('score', 0)),
+                        'text': _text_preview(doc, previews),
+                        'doc_id': _doc_id_from_source(source),
+                        'page_number': metadata.get('page', metadata.get('page_label')),
+                    })
 
-                    # Mark query as pending so callback skips it
-                    _get_pending_pipeline_queries().add(query)
+                # Mark query as pending so callback skips it
+                _get_pending_pipeline_queries().add(query)
 
-                    # Send retrieval event with final compressed results
-                    self.store.log_retrieval(
-                        query=query,
-                        results=final_results,
-                        duration_ms=total_duration,
-                        retrieval_id=retrieval_id,
-                    )
+                # Retrieval event with final compressed results ships with the stages
+                self.store.log_retrieval_deferred(
+                    query=query,
+                    results=final_results,
+                    duration_ms=total_duration,
+                    batch=events,
+                    retrieval_id=retrieval_id,
+                )
+                self._flush_events(events)
 
+                if _DEBUG:
                     print(f"[SourcemapR] ContextualCompression: {len(base_docs)} → {len(compressed_docs)} docs ({total_duration:.0f}ms)")
 
+            def patched_get_docs(self_retriever, query, *, run_manager=None):
+                if not self.store.enabled:
+                    return original_get_docs(self_retriever, query, run_manager=run_manager)
+                start_ns = time.perf_counter_ns()
+
+                # Set context to skip callback logging (we handle it here)
+                pipeline_token = _pipeline_active.set(True)
+
+                try:
+                    # Stage 1: Base retrieval
+                    base_start_ns = time.perf_counter_ns()
+                    base_docs = self_retriever.base_retriever.get_relevant_documents(query)
+                    base_duration = (time.perf_counter_ns() - base_start_ns) / 1e6
+
+                    # Stage 2: Compression/Reranking
+                    compress_start_ns = time.perf_counter_ns()
+                    compressed_docs = self_retriever.base_compressor.compress_documents(base_docs, query)
+                    compress_duration = (time.perf_counter_ns() - compress_start_ns) / 1e6
+
+                    record_pipeline(self_retriever, query, start_ns,
+                                    base_docs, base_duration, compressed_docs, compress_duration)
                     return list(compressed_docs)
                 finally:
                     # Always reset the pipeline context
-                    _set_pipeline_context(False)
+                    _pipeline_active.reset(pipeline_token)
+
+            async def patched_aget_docs(self_retriever, query, *, run_manager=None):
+                if not self.store.enabled:
+                    return await original_aget_docs(self_retriever, query, run_manager=run_manager)
+                start_ns = time.perf_counter_ns()
+
+                # The context var is task-local, so concurrent queries don't interfere
+                pipeline_token = _pipeline_active.set(True)
+
+                try:
+                    base_start_ns = time.perf_counter_ns()
+                    base_docs = await self_retriever.base_retriever.aget_relevant_documents(query)
+                    base_duration = (time.perf_counter_ns() - base_start_ns) / 1e6
+
+                    compress_start_ns = time.perf_counter_ns()
+                    compressed_docs = await self_retriever.base_compressor.acompress_documents(base_docs, query)
+                    compress_duration = (time.perf_counter_ns() - compress_start_ns) / 1e6
+
+                    record_pipeline(self_retriever, query, start_ns,
+                                    base_docs, base_duration, compressed_docs, compress_duration)
+                    return list(compressed_docs)
+                finally:
+                    _pipeline_active.reset(pipeline_token)
 
             patched_get_docs._sourcemapr_patched = True
+            patched_aget_docs._sourcemapr_patched = True
             ContextualCompressionRetriever._get_relevant_documents = patched_get_docs
-            self._original_handlers['ContextualCompressionRetriever._get_relevant_documents'] = original_get_docs
+            ContextualCompressionRetriever._aget_relevant_documents = patched_aget_docs
+            self._original_handlers['ContextualCompressionRetriever._get_relevant_documents'] = (
+                ContextualCompressionRetriever, '_get_relevant_documents', original_get_docs
+            )
+            self._original_handlers['ContextualCompressionRetriever._aget_relevant_documents'] = (
+                ContextualCompressionRetriever, '_aget_relevant_documents', original_aget_docs
+            )
             print("[SourcemapR] Patched ContextualCompressionRetriever (reranking tracked)")
         except ImportError:
             pass
@@ -802,25 +1192,29 @@ class LangChainProvider(BaseProvider):
         """Patch MultiQueryRetriever to track query expansion stages."""
         try:
             from langchain.retrievers.multi_query import MultiQueryRetriever
-            import uuid
 
             if hasattr(MultiQueryRetriever._get_relevant_documents, '_sourcemapr_patched'):
                 return
 
             original_get_docs = MultiQueryRetriever._get_relevant_documents
-
-            def patched_get_docs(self_retriever, query, *, run_manager=None):
-                import time
-                start_time = time.time()
-                pipeline_id = str(uuid.uuid4())[:12]
-
-                # Generate query variants
-                expand_start = time.time()
-                queries = self_retriever.generate_queries(query, run_manager)
-                expand_duration = (time.time() - expand_start) * 1000
+            original_aget_docs = MultiQueryRetriever._aget_relevant_documents
+
+            def record_pipeline(self_retriever, query, start_ns,
+                                queries, expand_duration, doc_lists, retrieve_duration):
+                """Log the stages, pipeline record and final results of one query.
+
+                Returns the deduplicated documents.
+                """
+                pipeline_id = uuid4().hex[:12]
+                # Stage, pipeline and retrieval events, queued together once the pipeline is known
+                events = []
+                # Text previews by id(doc); the same documents recur across stages
+                previews = {}
+                # Chunk ids by id(doc), for the same reason
+                chunk_ids = {}
 
                 # Log query expansion stage
-                self.store._send_queue.put({
+                events.append({
                     'type': 'pipeline_stage',
                     'data': {
                         'stage_id': f"{pipeline_id}_expansion",
@@ -839,50 +1233,47 @@ class LangChainProvider(BaseProvider):
                     }
                 })
 
-                # Retrieve for each query
-                retrieve_start = time.time()
                 all_docs = []
                 docs_by_query = {}
-                for i, q in enumerate(queries):
-                    docs = self_retriever.retriever.get_relevant_documents(q)
+                query_idx = {}  # 1-based position of each query's first occurrence
+                for n, (q, docs) in enumerate(zip(queries, doc_lists), 1):
                     docs_by_query[q] = docs
+                    query_idx.setdefault(q, n)
                     all_docs.extend(docs)
-                retrieve_duration = (time.time() - retrieve_start) * 1000
 
                 # Deduplicate
                 unique_docs = self_retriever.unique_union(all_docs)
 
-                # Track chunks from each query
+                # Track chunks from each query (first sighting of each chunk id)
                 retrieval_chunks = []
-                seen_chunks = set()
+                chunks_by_id = {}
                 for q, docs in docs_by_query.items():
                     for i, doc in enumerate(docs):
-                        source = doc.metadata.get('source', 'unknown')
-                        chunk_id = doc.metadata.get('chunk_id', f"{source}_{hash(doc.page_content) % 10000}")
-                        if chunk_id not in seen_chunks:
-                            seen_chunks.add(chunk_id)
-                            retrieval_chunks.append({
+                        metadata = doc.metadata or {}
+                        source = metadata.get('source', 'unknown')
+                        chunk_id = _retrieved_chunk_id(doc, chunk_ids)
+                        if chunk_id not in chunks_by_id:
+                            chunks_by_id[chunk_id] = chunk = {
                                 'chunk_id': chunk_id,
-                                'doc_id': os.path.basename(source) if source != 'unknown' else 'unknown',
-                                'text': doc.page_content[:500],
+                                'doc_id': _doc_id_from_source(source),
+                                'text': _text_preview(doc, previews),
                                 'input_rank': i + 1,
                                 'output_rank': None,  # Set after dedup
-                                'input_score': doc.metadata.get('score', 0),
-                                'output_score': doc.metadata.get('score', 0),
-                                'source': f"query_{queries.index(q)+1}",
+                                'input_score': metadata.get('score', 0),
+                                'output_score': metadata.get('score', 0),
+                                'source': f"query_{query_idx[q]}",
                                 'status': 'kept',
-                            })
+                            }
+                            retrieval_chunks.append(chunk)
 
                 # Update output ranks for kept chunks
                 for i, doc in enumerate(unique_docs):
-                    chunk_id = doc.metadata.get('chunk_id', f"{doc.metadata.get('source', 'unknown')}_{hash(doc.page_content) % 10000}")
-                    for chunk in retrieval_chunks:
-                        if chunk['chunk_id'] == chunk_id and chunk['output_rank'] is None:
-                            chunk['output_rank'] = i + 1
-                            break
+                    chunk = chunks_by_id.get(_retrieved_chunk_id(doc, chunk_ids))
+                    if chunk is not None and chunk['output_rank'] is None:
+                        chunk['output_rank'] = i + 1
 
                 # Log retrieval stage
-                self.store._send_queue.put({
+                events.append({
                     'type': 'pipeline_stage',
                     'data': {
                         'stage_id': f"{pipeline_id}_retrieval",
@@ -902,13 +1293,13 @@ class LangChainProvider(BaseProvider):
                     }
                 })
 
-                total_duration = (time.time() - start_time) * 1000
+                total_duration = (time.perf_counter_ns() - start_ns) / 1e6
 
                 # Generate retrieval_id to link retrieval and pipeline
                 retrieval_id = f"ret_{pipeline_id}"
 
                 # Send pipeline record
-                self.store._send_queue.put({
+                events.append({
                     'type': 'pipeline',
                     'data': {
                         'pipeline_id': pipeline_id,
@@ -927,26 +1318,73 @@ class LangChainProvider(BaseProvider):
                     final_results.append({
                         'chunk_id': metadata.get('chunk_id', f"chunk_{i}"),
                         'score': metadata.get('score', 0),
-                        'text': doc.page_content[:500] if hasattr(doc, 'page_content') else '',
-                        'doc_id': os.path.basename(source) if source != 'unknown' else 'unknown',
+                        'text': _text_preview(doc, previews),
+                        'doc_id': _doc_id_from_source(source),
                         'page_number': metadata.get('page', metadata.get('page_label')),
                     })
 
-                # Send retrieval event
-                self.store.log_retrieval(
+                # Retrieval event ships with the stages
+                self.store.log_retrieval_deferred(
                     query=query,
                     results=final_results,
                     duration_ms=total_duration,
+                    batch=events,
                     retrieval_id=retrieval_id,
                 )
+                self._flush_events(events)
 
-                print(f"[SourcemapR] MultiQuery: {len(queries)} queries → {len(all_docs)} docs → {len(unique_docs)} unique ({total_duration:.0f}ms)")
+                if _DEBUG:
+                    print(f"[SourcemapR] MultiQuery: {len(queries)} queries → {len(all_docs)} docs → {len(unique_docs)} unique ({total_duration:.0f}ms)")
 
                 return unique_docs
 
+            def patched_get_docs(self_retriever, query, *, run_manager=None):
+                if not self.store.enabled:
+                    return original_get_docs(self_retriever, query, run_manager=run_manager)
+                start_ns = time.perf_counter_ns()
+
+                # Generate query variants
+                expand_start_ns = time.perf_counter_ns()
+                queries = self_retriever.generate_queries(query, run_manager)
+                expand_duration = (time.perf_counter_ns() - expand_start_ns) / 1e6
+
+                # Retrieve for each query (concurrently when there are several)
+                retrieve_start_ns = time.perf_counter_ns()
+                doc_lists = _map_retrievals(self_retriever.retriever.get_relevant_documents, queries)
+                retrieve_duration = (time.perf_counter_ns() - retrieve_start_ns) / 1e6
+
+                return record_pipeline(self_retriever, query, start_ns,
+                                       queries, expand_duration, doc_lists, retrieve_duration)
+
+            async def patched_aget_docs(self_retriever, query, *, run_manager=None):
+                if not self.store.enabled:
+                    return await original_aget_docs(self_retriever, query, run_manager=run_manager)
+                start_ns = time.perf_counter_ns()
+
+                expand_start_ns = time.perf_counter_ns()
+                queries = await self_retriever.agenerate_queries(query, run_manager)
+                expand_duration = (time.perf_counter_ns() - expand_start_ns) / 1e6
+
+                # Query variants are retrieved concurrently
+                retrieve_start_ns = time.perf_counter_ns()
+                doc_lists = await asyncio.gather(
+                    *(self_retriever.retriever.aget_relevant_documents(q) for q in queries)
+                )
+                retrieve_duration = (time.perf_counter_ns() - retrieve_start_ns) / 1e6
+
+                return record_pipeline(self_retriever, query, start_ns,
+                                       queries, expand_duration, doc_lists, retrieve_duration)
+
             patched_get_docs._sourcemapr_patched = True
+            patched_aget_docs._sourcemapr_patched = True
             MultiQueryRetriever._get_relevant_documents = patched_get_docs
-            self._original_handlers['MultiQueryRetriever._get_relevant_documents'] = original_get_docs
+            MultiQueryRetriever._aget_relevant_documents = patched_aget_docs
+            self._original_handlers['MultiQueryRetriever._get_relevant_documents'] = (
+                MultiQueryRetriever, '_get_relevant_documents', original_get_docs
+            )
+            self._original_handlers['MultiQueryRetriever._aget_relevant_documents'] = (
+                MultiQueryRetriever, '_aget_relevant_documents', original_aget_docs
+            )
             print("[SourcemapR] Patched MultiQueryRetriever (query expansion tracked)")
         except ImportError:
             pass
@@ -955,25 +1393,31 @@ class LangChainProvider(BaseProvider):
         """Patch EnsembleRetriever to track hybrid search stages."""
         try:
             from langchain.retrievers import EnsembleRetriever
-            import uuid
 
             if hasattr(EnsembleRetriever._get_relevant_documents, '_sourcemapr_patched'):
                 return
 
             original_get_docs = EnsembleRetriever._get_relevant_documents
-
-            def patched_get_docs(self_retriever, query, *, run_manager=None):
-                import time
-                start_time = time.time()
-                pipeline_id = str(uuid.uuid4())[:12]
-
-                # Get docs from each retriever
+            original_aget_docs = EnsembleRetriever._aget_relevant_documents
+
+            def record_pipeline(self_retriever, query, start_ns,
+                                retriever_runs, result_docs, merge_duration):
+                """Log the stages, pipeline record and final results of one query.
+
+                ``retriever_runs`` holds one ``(docs, duration_ms)`` pair per retriever.
+                """
+                pipeline_id = uuid4().hex[:12]
+                # Stage, pipeline and retrieval events, queued together once the pipeline is known
+                events = []
+                # Text previews by id(doc); the same documents recur across stages
+                previews = {}
+                # Chunk ids by id(doc), for the same reason
+                chunk_ids = {}
+
+                # Collect docs from each retriever
                 all_chunks = []
                 retriever_results = []
-                for i, retriever in enumerate(self_retriever.retrievers):
-                    ret_start = time.time()
-                    docs = retriever.get_relevant_documents(query)
-                    ret_duration = (time.time() - ret_start) * 1000
+                for i, (retriever, (docs, ret_duration)) in enumerate(zip(self_retriever.retrievers, retriever_runs)):
                     retriever_name = retriever.__class__.__name__
                     weight = self_retriever.weights[i] if self_retriever.weights else 1.0 / len(self_retriever.retrievers)
 
@@ -985,23 +1429,31 @@ class LangChainProvider(BaseProvider):
                     })
 
                     for j, doc in enumerate(docs):
-                        source = doc.metadata.get('source', 'unknown')
-                        chunk_id = doc.metadata.get('chunk_id', f"{source}_{hash(doc.page_content) % 10000}")
+                        metadata = doc.metadata or {}
+                        source = metadata.get('source', 'unknown')
+                        chunk_id = _retrieved_chunk_id(doc, chunk_ids)
                         all_chunks.append({
                             'chunk_id': chunk_id,
-                            'doc_id': os.path.basename(source) if source != 'unknown' else 'unknown',
-                            'text': doc.page_content[:500],
+                            'doc_id': _doc_id_from_source(source),
+                            'text': _text_preview(doc, previews),
                             'input_rank': j + 1,
                             'output_rank': None,
-                            'input_score': doc.metadata.get('score', 0),
+                            'input_score': metadata.get('score', 0),
                             'output_score': None,
                             'source': retriever_name,
                             'status': 'kept',
                         })
 
+                # Group chunks by retriever name and queue unranked ones per chunk id
+                chunks_by_name = defaultdict(list)
+                unranked_by_id = defaultdict(deque)
+                for chunk in all_chunks:
+                    chunks_by_name[chunk['source']].append(chunk)
+                    unranked_by_id[chunk['chunk_id']].append(chunk)
+
                 # Log individual retriever stages
                 for i, result in enumerate(retriever_results):
-                    self.store._send_queue.put({
+                    events.append({
                         'type': 'pipeline_stage',
                         'data': {
                             'stage_id': f"{pipeline_id}_retriever_{i}",
@@ -1013,26 +1465,21 @@ class LangChainProvider(BaseProvider):
                             'output_count': len(result['docs']),
                             'duration_ms': result['duration_ms'],
                             'metadata': {'weight': result['weight']},
-                            'chunks': [c for c in all_chunks if c['source'] == result['name']],
+                            'chunks': chunks_by_name[result['name']],
                         }
                     })
 
-                # Call original to get merged results
-                merge_start = time.time()
-                result_docs = original_get_docs(self_retriever, query, run_manager=run_manager)
-                merge_duration = (time.time() - merge_start) * 1000
-
                 # Update output ranks and scores
                 for i, doc in enumerate(result_docs):
-                    chunk_id = doc.metadata.get('chunk_id', f"{doc.metadata.get('source', 'unknown')}_{hash(doc.page_content) % 10000}")
-                    for chunk in all_chunks:
-                        if chunk['chunk_id'] == chunk_id and chunk['output_rank'] is None:
-                            chunk['output_rank'] = i + 1
-                            chunk['output_score'] = doc.metadata.get('score', chunk['input_score'])
-                            break
+                    metadata = doc.metadata or {}
+                    unranked = unranked_by_id.get(_retrieved_chunk_id(doc, chunk_ids))
+                    if unranked:
+                        chunk = unranked.popleft()
+                        chunk['output_rank'] = i + 1
+                        chunk['output_score'] = metadata.get('score', chunk['input_score'])
 
                 # Log merge stage
-                self.store._send_queue.put({
+                events.append({
                     'type': 'pipeline_stage',
                     'data': {
                         'stage_id': f"{pipeline_id}_merge",
@@ -1051,14 +1498,14 @@ class LangChainProvider(BaseProvider):
                     }
                 })
 
-                total_duration = (time.time() - start_time) * 1000
+                total_duration = (time.perf_counter_ns() - start_ns) / 1e6
                 total_input = sum(len(r['docs']) for r in retriever_results)
 
                 # Generate retrieval_id to link retrieval and pipeline
                 retrieval_id = f"ret_{pipeline_id}"
 
                 # Send pipeline record
-                self.store._send_queue.put({
+                events.append({
                     'type': 'pipeline',
                     'data': {
                         'pipeline_id': pipeline_id,
@@ -1077,26 +1524,94 @@ class LangChainProvider(BaseProvider):
                     final_results.append({
                         'chunk_id': metadata.get('chunk_id', f"chunk_{i}"),
                         'score': metadata.get('score', 0),
-                        'text': doc.page_content[:500] if hasattr(doc, 'page_content') else '',
-                        'doc_id': os.path.basename(source) if source != 'unknown' else 'unknown',
+                        'text': _text_preview(doc, previews),
+                        'doc_id': _doc_id_from_source(source),
                         'page_number': metadata.get('page', metadata.get('page_label')),
                     })
 
-                # Send retrieval event
-                self.store.log_retrieval(
+                # Retrieval event ships with the stages
+                self.store.log_retrieval_deferred(
                     query=query,
                     results=final_results,
                     duration_ms=total_duration,
+                    batch=events,
                     retrieval_id=retrieval_id,
                 )
+                self._flush_events(events)
+
+                if _DEBUG:
+                    print(f"[SourcemapR] Ensemble: {len(self_retriever.retrievers)} retrievers → {total_input} docs → {len(result_docs)} merged ({total_duration:.0f}ms)")
+
+            def merge_runs(self_retriever, retriever_runs):
+                """Fuse the doc lists already fetched, as EnsembleRetriever would.
+
+                Returns None when the retriever has no ``weighted_reciprocal_rank``,
+                in which case the caller falls back to the original method (and
+                each retriever is queried a second time).
+                """
+                fuse = getattr(self_retriever, 'weighted_reciprocal_rank', None)
+                if fuse is None:
+                    return None
+                return fuse([docs for docs, _ in retriever_runs])
+
+            def patched_get_docs(self_retriever, query, *, run_manager=None):
+                if not self.store.enabled:
+                    return original_get_docs(self_retriever, query, run_manager=run_manager)
+                start_ns = time.perf_counter_ns()
+
+                def timed_retrieval(retriever):
+                    ret_start_ns = time.perf_counter_ns()
+                    docs = retriever.get_relevant_documents(query)
+                    return docs, (time.perf_counter_ns() - ret_start_ns) / 1e6
+
+                # Get docs from each retriever (concurrently when there are several)
+                retriever_runs = _map_retrievals(timed_retrieval, self_retriever.retrievers)
+
+                merge_start_ns = time.perf_counter_ns()
+                result_docs = merge_runs(self_retriever, retriever_runs)
+                if result_docs is None:
+                    result_docs = original_get_docs(self_retriever, query, run_manager=run_manager)
+                merge_duration = (time.perf_counter_ns() - merge_start_ns) / 1e6
+
+                record_pipeline(self_retriever, query, start_ns,
+                                retriever_runs, result_docs, merge_duration)
+                return result_docs
+
+            async def patched_aget_docs(self_retriever, query, *, run_manager=None):
+                if not self.store.enabled:
+                    return await original_aget_docs(self_retriever, query, run_manager=run_manager)
+                start_ns = time.perf_counter_ns()
+
+                async def timed_retrieval(retriever):
+                    ret_start_ns = time.perf_counter_ns()
+                    docs = await retriever.aget_relevant_documents(query)
+                    return docs, (time.perf_counter_ns() - ret_start_ns) / 1e6
+
+                # Retrievers run concurrently; each keeps its own duration
+                retriever_runs = await asyncio.gather(
+                    *(timed_retrieval(retriever) for retriever in self_retriever.retrievers)
+                )
 
-                print(f"[SourcemapR] Ensemble: {len(self_retriever.retrievers)} retrievers → {total_input} docs → {len(result_docs)} merged ({total_duration:.0f}ms)")
+                merge_start_ns = time.perf_counter_ns()
+                result_docs = merge_runs(self_retriever, retriever_runs)
+                if result_docs is None:
+                    result_docs = await original_aget_docs(self_retriever, query, run_manager=run_manager)
+                merge_duration = (time.perf_counter_ns() - merge_start_ns) / 1e6
 
+                record_pipeline(self_retriever, query, start_ns,
+                                retriever_runs, result_docs, merge_duration)
                 return result_docs
 
             patched_get_docs._sourcemapr_patched = True
+            patched_aget_docs._sourcemapr_patched = True
             EnsembleRetriever._get_relevant_documents = patched_get_docs
-            self._original_handlers['EnsembleRetriever._get_relevant_documents'] = original_get_docs
+            EnsembleRetriever._aget_relevant_documents = patched_aget_docs
+            self._original_handlers['EnsembleRetriever._get_relevant_documents'] = (
+                EnsembleRetriever, '_get_relevant_documents', original_get_docs
+            )
+            self._original_handlers['EnsembleRetriever._aget_relevant_documents'] = (
+                EnsembleRetriever, '_aget_relevant_documents', original_aget_docs
+            )
             print("[SourcemapR] Patched EnsembleRetriever (hybrid search tracked)")
         except ImportError:
             pass
@@ -1111,32 +1626,40 @@ class LangChainProvider(BaseProvider):
 
             original = TextSplitter.split_documents
 
-            def _get_page_for_position(position, page_positions):
-                """Get page number for a text position."""
-                if not page_positions:
-                    return 1
-                for page_num, (start, end) in sorted(page_positions.items()):
-                    if start <= position < end:
-                        return page_num
-                return max(page_positions.keys()) if page_positions else 1
-
             def patched_split(self_splitter, documents, *args, **kwargs):
                 result = original(self_splitter, documents, *args, **kwargs)
+                if not self.store.enabled:
+                    return result
                 splitter_name = self_splitter.__class__.__name__
 
-                # Get HTML page positions from document loader
-                html_page_positions = DocumentLoaderPatcher._html_page_positions
+                # Get HTML state recorded by the document loader patcher
+                loader_patcher = self._loader_patcher
+                html_page_positions = loader_patcher._html_page_positions if loader_patcher else {}
+                raw_html_content = loader_patcher._raw_html_content if loader_patcher else {}
+                loader_texts = loader_patcher._loader_text if loader_patcher else {}
 
                 # First pass: collect all chunk data in order
+                ANCHOR_LEN = 50
                 all_chunk_data = []
-                chunks_by_source = {}
+                # Page numbers of HTML chunks per source, for the summary line
+                html_pages_by_source = {}
+                # Chunks share a handful of sources; resolve each path once
+                path_cache = {}
+                # Position -> page lookups, built once per HTML source
+                page_lookups = {}
 
                 for i, doc in enumerate(result):
                     metadata = doc.metadata or {}
                     source = metadata.get('source', '')
-                    abs_path = os.path.abspath(source) if source else ''
-                    filename = os.path.basename(source) if source else ''
-                    file_ext = abs_path.lower().split('.')[-1] if abs_path else ''
+                    paths = path_cache.get(source)
+                    if paths is None:
+                        abs_path = os.path.abspath(source) if source else ''
+                        paths = path_cache[source] = (
+                            abs_path,
+                            os.path.basename(source) if source else '',
+                            abs_path.lower().endswith(HTML_EXTENSIONS),
+                        )
+                    abs_path, filename, is_html = paths
 
                     # Extract character indices
                     start_char_idx = metadata.get('start_index')
@@ -1150,99 +1673,84 @@ class LangChainProvider(BaseProvider):
                     page_from_meta = metadata.get('page')
                     if page_from_meta is not None:
                         page_number = page_from_meta + 1 if isinstance(page_from_meta, int) else page_from_meta
-                    elif file_ext in ('htm', 'html', 'xhtml') and filename in html_page_positions and start_char_idx is not None:
+                    elif is_html and filename in html_page_positions and start_char_idx is not None:
                         # Use HTML page positions for page detection
-                        page_number = _get_page_for_position(start_char_idx, html_page_positions[filename])
+                        page_for = page_lookups.get(filename)
+                        if page_for is None:
+                            page_for = page_lookups[filename] = build_page_lookup(html_page_positions[filename])
+                        page_number = page_for(start_char_idx)
                     else:
                         page_number = 1
 
-                    chunk_metadata = dict(metadata)
-                    chunk_metadata['file_path'] = abs_path
-
                     # Store chunk data for second pass
                     all_chunk_data.append({
                         'index': i,
                         'doc_id': filename,
-                        'file_ext': file_ext,
+                        'is_html': is_html,
                         'text': doc.page_content,
                         'page_number': page_number,
                         'start_char_idx': start_char_idx,
                         'end_char_idx': end_char_idx,
-                        'metadata': chunk_metadata,
+                        'file_path': abs_path,
+                        'metadata': metadata,
+                        # XBRL/metadata chunks aren't visible in rendered HTML; skip them as anchors
+                        'visible': _is_visible_chunk(doc.page_content),
+                        # Anchor text neighbours take from this chunk (first/last N chars)
+                        'anchor_head': doc.page_content[:ANCHOR_LEN],
+                        'anchor_tail': doc.page_content[-ANCHOR_LEN:],
                     })
 
-                    # Collect chunks by source for stats
-                    if filename:
-                        if filename not in chunks_by_source:
-                            chunks_by_source[filename] = {
-                                'file_path': abs_path,
-                                'chunks': []
-                            }
-                        chunks_by_source[filename]['chunks'].append({
-                            'index': i,
-                            'text': doc.page_content,
-                            'page_number': page_number,
-                            'start_char_idx': start_char_idx
-                        })
-
-                # Helper to detect XBRL/metadata chunks that won't be visible in rendered HTML
-                def is_visible_chunk(text):
-                    """Check if chunk text is visible content (not XBRL/metadata)."""
-                    if not text or len(text) < 20:
-                        return False
-                    # XBRL patterns: URLs, namespace prefixes, Member suffixes
-                    xbrl_indicators = ['http://', 'https://', 'us-gaap:', 'tsla:', 'srt:', 'Member', 'xbrli:', 'xbrldi:']
-                    text_lower = text.lower()
-                    xbrl_count = sum(1 for ind in xbrl_indicators if ind.lower() in text_lower)
-                    # If more than 2 XBRL indicators, likely metadata
-                    if xbrl_count > 2:
-                        return False
-                    # Check if mostly alphanumeric soup (namespace URIs)
-                    words = text.split()
-                    if words and len(words[0]) > 50:  # Very long first "word" is likely a URI
-                        return False
-                    return True
-
-                def find_visible_chunk(chunks, start_idx, direction):
-                    """Find nearest visible chunk in given direction (-1 for prev, +1 for next)."""
-                    idx = start_idx + direction
-                    search_limit = 10  # Don't search too far
-                    count = 0
-                    while 0 <= idx < len(chunks) and count < search_limit:
-                        if is_visible_chunk(chunks[idx]['text']):
-                            return chunks[idx]['text']
-                        idx += direction
-                        count += 1
-                    return None
+                    # Only HTML sources need per-source stats
+                    if _DEBUG and filename and is_html:
+                        html_pages_by_source.setdefault(filename, []).append(page_number)
+
+                # Nearest visible chunk on each side of every chunk, found with one
+                # sweep per direction; neighbours further than SEARCH_LIMIT are ignored
+                SEARCH_LIMIT = 10
+                num_chunks = len(all_chunk_data)
+                prev_visible = [-1] * num_chunks
+                next_visible = [-1] * num_chunks
+                last = -1
+                for i in range(num_chunks):
+                    prev_visible[i] = last
+                    if all_chunk_data[i]['visible']:
+                        last = i
+                last = -1
+                for i in range(num_chunks - 1, -1, -1):
+                    next_visible[i] = last
+                    if all_chunk_data[i]['visible']:
+                        last = i
 
                 # Second pass: calculate HTML positions with context, add anchors, and log chunks
-                ANCHOR_LEN = 50
+                chunk_records = []
+                # HTML sources whose position mapping failed; skipped for the rest of this split
+                unmappable_html = set()
                 for i, chunk_data in enumerate(all_chunk_data):
                     filename = chunk_data['doc_id']
-                    file_ext = chunk_data.get('file_ext', '')
 
                     # Get surrounding VISIBLE chunk text for anchors (skip XBRL metadata)
-                    prev_text = find_visible_chunk(all_chunk_data, i, -1)
-                    next_text = find_visible_chunk(all_chunk_data, i, +1)
-
-                    # Get anchor from previous visible chunk (last N chars)
-                    prev_anchor = prev_text[-ANCHOR_LEN:] if prev_text and len(prev_text) > ANCHOR_LEN else prev_text
+                    prev_idx = prev_visible[i]
+                    next_idx = next_visible[i]
+                    prev_chunk = all_chunk_data[prev_idx] if prev_idx >= 0 and i - prev_idx <= SEARCH_LIMIT else None
+                    next_chunk = all_chunk_data[next_idx] if next_idx >= 0 and next_idx - i <= SEARCH_LIMIT else None
+                    prev_text = prev_chunk['text'] if prev_chunk else None
+                    next_text = next_chunk['text'] if next_chunk else None
 
-                    # Get anchor from next visible chunk (first N chars)
-                    next_anchor = next_text[:ANCHOR_LEN] if next_text and len(next_text) > ANCHOR_LEN else next_text
+                    # Anchors: end of the previous visible chunk, start of the next one
+                    prev_anchor = prev_chunk['anchor_tail'] if prev_chunk else None
+                    next_anchor = next_chunk['anchor_head'] if next_chunk else None
 
                     # Calculate HTML positions using surrounding chunks for triangulation
                     html_start_idx = None
                     html_end_idx = None
-                    if file_ext in ('htm', 'html', 'xhtml') and filename in DocumentLoaderPatcher._raw_html_content:
+                    if chunk_data['is_html'] and filename in raw_html_content and filename not in unmappable_html:
                         try:
-                            from sourcemapr.utils.html_text_extractor import get_html_positions_for_chunk
-                            raw_html = DocumentLoaderPatcher._raw_html_content[filename]
-                            loader_text = DocumentLoaderPatcher._loader_text.get(filename, '')
+                            loader_text = loader_texts.get(filename, '')
 
                             if chunk_data['start_char_idx'] is not None and loader_text:
-                                html_start_idx, html_end_idx = get_html_positions_for_chunk(
-                                    raw_html,
+                                # Shared by all chunks of the file (and by later splits of it)
+                                locator = loader_patcher.html_locator(filename)
+                                html_start_idx, html_end_idx = locator.get_positions(
                                     loader_text,
                                     chunk_data['start_char_idx'],
                                     chunk_data['end_char_idx'] or chunk_data['start_char_idx'] + len(chunk_data['text']),
@@ -1251,66 +1759,62 @@ class LangChainProvider(BaseProvider):
                                     next_chunk_text=next_text
                                 )
                         except Exception as e:
-                            pass  # Silently continue if position mapping fails
-
-                    self.store.log_chunk(
-                        chunk_id=f"{chunk_data['doc_id']}_{chunk_data['index']}",
-                        doc_id=chunk_data['doc_id'],
-                        index=chunk_data['index'],
-                        text=chunk_data['text'],
-                        page_number=chunk_data['page_number'],
-                        start_char_idx=chunk_data['start_char_idx'],
-                        end_char_idx=chunk_data['end_char_idx'],
-                        html_start_idx=html_start_idx,
-                        html_end_idx=html_end_idx,
-                        prev_anchor=prev_anchor,
-                        next_anchor=next_anchor,
-                        metadata=chunk_data['metadata']
-                    )
-
-                # Build parsed text for HTML files (already handled by document loader, but update if chunks have new page info)
-                for filename, data in chunks_by_source.items():
-                    file_path = data['file_path']
-                    file_ext = file_path.lower().split('.')[-1] if file_path else ''
+                            # Report once and stop retrying this file's chunks
+                            unmappable_html.add(filename)
+                            print(f"[SourcemapR] Warning: HTML position mapping failed for {filename}: {e}")
+
+                    chunk_records.append({
+                        'chunk_id': f"{chunk_data['doc_id']}_{chunk_data['index']}",
+                        'doc_id': chunk_data['doc_id'],
+                        'index': chunk_data['index'],
+                        'text': chunk_data['text'],
+                        'page_number': chunk_data['page_number'],
+                        'start_char_idx': chunk_data['start_char_idx'],
+                        'end_char_idx': chunk_data['end_char_idx'],
+                        'html_start_idx': html_start_idx,
+                        'html_end_idx': html_end_idx,
+                        'prev_anchor': prev_anchor,
+                        'next_anchor': next_anchor,
+                        'file_path': chunk_data['file_path'],
+                        'metadata': chunk_data['metadata'],
+                    })
 
-                    if file_ext in ('htm', 'html', 'xhtml') and data['chunks']:
-                        sorted_chunks = sorted(data['chunks'], key=lambda x: x.get('start_char_idx') or x['index'])
+                self.store.log_chunks_bulk(chunk_records)
 
-                        # Count pages for logging
-                        pages_found = set(c.get('page_number', 1) for c in sorted_chunks)
-                        print(f"[SourcemapR] HTML chunks: {filename} ({len(data['chunks'])} chunks across {len(pages_found)} pages)")
+                if _DEBUG:
+                    # Summarize HTML sources (empty, and skipped, for all-PDF splits)
+                    for filename, pages in html_pages_by_source.items():
+                        print(f"[SourcemapR] HTML chunks: {filename} ({len(pages)} chunks across {len(set(pages))} pages)")
 
-                print(f"[SourcemapR] {splitter_name}: {len(result)} chunks created")
+                    print(f"[SourcemapR] {splitter_name}: {len(result)} chunks created")
                 return result
 
             patched_split._sourcemapr_patched = True
             TextSplitter.split_documents = patched_split
-            self._original_handlers['langchain_text_splitters.base.TextSplitter.split_documents'] = original
+            self._original_handlers['langchain_text_splitters.base.TextSplitter.split_documents'] = (
+                TextSplitter, 'split_documents', original
+            )
             print("[SourcemapR] Patched TextSplitter base class (all splitters)")
         except ImportError:
             pass
     
     def uninstrument(self) -> None:
         """Restore original methods."""
-        for name, original in self._original_handlers.items():
+        for cls, method_name, original in self._original_handlers.values():
             try:
-                parts = name.split('.')
-                if len(parts) == 2:
-                    cls_name, method_name = parts
-                    if cls_name == 'PyPDFLoader':
-                        from langchain_community.document_loaders import PyPDFLoader
-                        setattr(PyPDFLoader, method_name, original)
-                    elif cls_name == 'DirectoryLoader':
-                        from langchain_community.document_loaders import DirectoryLoader
-                        setattr(DirectoryLoader, method_name, original)
-                    elif cls_name == 'TextLoader':
-                        from langchain_community.document_loaders import TextLoader
-                        setattr(TextLoader, method_name, original)
-                    elif cls_name == 'UnstructuredFileLoader':
-                        from langchain_community.document_loaders import UnstructuredFileLoader
-                        setattr(UnstructuredFileLoader, method_name, original)
+                setattr(cls, method_name, original)
             except Exception:
                 pass
-        
+
+        if self._import_hooks is not None:
+            self._import_hooks.clear()
+            if self._import_hooks in sys.meta_path:
+                sys.meta_path.remove(self._import_hooks)
+            self._import_hooks = None
+
+        if self._loader_patcher is not None:
+            self._loader_patcher.clear()
+            self._loader_patcher = None
+
         self._original_handlers.clear()
         self._instrumented = False
@@ -13,11 +13,15 @@ Instruments LlamaIndex components:
 import time
 import os
 import re
+import uuid
+from collections import defaultdict
 from pathlib import Path
 from typing import Optional, Dict, Any
 
 from sourcemapr.providers.base import BaseProvider
-from sourcemapr.store import TraceStore
+from sourcemapr.store import TraceStore, _DEBUG
+from sourcemapr.utils.html_parser import HTML_EXTENSIONS, HTMLParser, build_page_lookup, scale_page_positions
+from sourcemapr.utils.html_text_extractor import HTMLChunkLocator
 
 
 # ============================================================================
@@ -47,13 +51,14 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
         def on_event_start(self, event_type: CBEventType, payload: Optional[Dict] = None,
                           event_id: str = "", parent_id: str = "", **kwargs):
             """Called when an event starts."""
+            if not self.store.enabled:
+                return event_id
             if event_type == CBEventType.QUERY:
                 query_str = ""
                 if payload and EventPayload.QUERY_STR in payload:
                     query_str = str(payload[EventPayload.QUERY_STR])
 
                 # Pre-generate retrieval_id and add to queue for LLM call to pick up
-                import uuid
                 retrieval_id = str(uuid.uuid4())[:12]
                 with self.store._retrieval_lock:
                     self.store._retrieval_id_queue.append(retrieval_id)
@@ -63,7 +68,8 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
                     "query_str": query_str,
                     "retrieval_id": retrieval_id  # Store for use in _handle_query_end
                 }
-                print(f"[SourcemapR] Query started: {query_str[:50]}...")
+                if _DEBUG:
+                    print(f"[SourcemapR] Query started: {query_str[:50]}...")
             
             elif event_type == CBEventType.LLM:
                 if self._skip_llm_logging:
@@ -90,13 +96,16 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
                     "temperature": temperature,
                     "max_tokens": max_tokens,
                 }
-                print(f"[SourcemapR] LLM call started: {model}")
+                if _DEBUG:
+                    print(f"[SourcemapR] LLM call started: {model}")
             
             return event_id
         
         def on_event_end(self, event_type: CBEventType, payload: Optional[Dict] = None,
                          event_id: str = "", **kwargs):
             """Called when an event ends."""
+            if not self.store.enabled:
+                return
             if event_type == CBEventType.QUERY:
                 self._handle_query_end(event_id, payload)
             elif event_type == CBEventType.LLM:
@@ -119,7 +128,8 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
                 source_nodes = getattr(response_obj, 'source_nodes', [])
                 response_text = str(response_obj) if response_obj else ""
 
-            print(f"[SourcemapR] Query completed: '{query_str[:30]}...' with {len(source_nodes)} sources")
+            if _DEBUG:
+                print(f"[SourcemapR] Query completed: '{query_str[:30]}...' with {len(source_nodes)} sources")
 
             results = []
             for i, n in enumerate(source_nodes):
@@ -220,10 +230,10 @@ def _create_callback_handler(store: TraceStore, skip_llm_logging: bool = False):
                 max_tokens=llm_data.get("max_tokens"),
                 provider="llamaindex"
             )
-            print(f"[SourcemapR] LLM call logged: {llm_data.get('model', 'unknown')} ({duration_ms:.0f}ms)")
+            if _DEBUG:
+                print(f"[SourcemapR] LLM call logged: {llm_data.get('model', 'unknown')} ({duration_ms:.0f}ms)")
         
         def start_trace(self, trace_id: Optional[str] = None) -> str:
-            import uuid
             return trace_id or str(uuid.uuid4())
         
         def end_trace(self, trace_id: Optional[str] = None, trace_map: Optional[Dict] = None) -> None:
@@ -298,10 +308,13 @@ def _build_html_parsed_text(chunks_by_doc, source_file_paths, store, html_page_p
     """
     for doc_id, chunks in chunks_by_doc.items():
         file_path = source_file_paths.get(doc_id, '')
-        file_ext = file_path.lower().split('.')[-1] if file_path else ''
 
-        if file_ext in ('htm', 'html', 'xhtml') and chunks:
-            sorted_chunks = sorted(chunks, key=lambda x: x['index'])
+        if chunks and file_path.lower().endswith(HTML_EXTENSIONS):
+            # Chunks are collected in index order; only sort if that was violated
+            if all(a['index'] < b['index'] for a, b in zip(chunks, chunks[1:])):
+                sorted_chunks = chunks
+            else:
+                sorted_chunks = sorted(chunks, key=lambda x: x['index'])
 
             # If we have page positions from HTML parsing, use them
             page_positions = None
@@ -310,18 +323,16 @@ def _build_html_parsed_text(chunks_by_doc, source_file_paths, store, html_page_p
 
             # Assign page numbers to chunks based on position
             if page_positions:
+                page_for = build_page_lookup(page_positions)
                 for chunk in sorted_chunks:
                     start_idx = chunk.get('start_char_idx')
                     if start_idx is not None:
-                        chunk['page_number'] = _get_page_for_position(start_idx, page_positions)
+                        chunk['page_number'] = page_for(start_idx)
 
             # Group chunks by page
-            pages_content = {}
+            pages_content = defaultdict(list)
             for chunk in sorted_chunks:
-                page_num = chunk.get('page_number') or 1
-                if page_num not in pages_content:
-                    pages_content[page_num] = []
-                pages_content[page_num].append(chunk['text'])
+                pages_content[chunk.get('page_number') or 1].append(chunk['text'])
 
             if len(pages_content) > 1:
                 parsed_parts = []
@@ -329,33 +340,15 @@ def _build_html_parsed_text(chunks_by_doc, source_file_paths, store, html_page_p
                     parsed_parts.append('\n\n'.join(pages_content[page_num]))
                 parsed_text = '\n\n--- PAGE BREAK ---\n\n'.join(parsed_parts)
             else:
-                parsed_text = '\n\n'.join([c['text'] for c in sorted_chunks])
+                parsed_text = '\n\n'.join(c['text'] for c in sorted_chunks)
 
             store.log_parsed(
                 doc_id=doc_id,
                 filename=doc_id,
                 text=parsed_text
             )
-            print(f"[SourcemapR] Built parsed text for HTML: {doc_id} ({len(chunks)} chunks, {len(pages_content)} pages)")
-
-
-def _get_page_for_position(position, page_positions):
-    """Get page number for a text position.
-
-    Args:
-        position: Character position in extracted text
-        page_positions: Dict mapping page_num -> (start, end)
-
-    Returns:
-        Page number (1-indexed)
-    """
-    if not page_positions:
-        return 1
-    for page_num, (start, end) in sorted(page_positions.items()):
-        if start <= position < end:
-            return page_num
-    # Return last page if beyond end
-    return max(page_positions.keys()) if page_positions else 1
+            if _DEBUG:
+                print(f"[SourcemapR] Built parsed text for HTML: {doc_id} ({len(chunks)} chunks, {len(pages_content)} pages)")
 
 
 def _extract_page_from_text(text):
@@ -466,6 +459,8 @@ class LlamaIndexProvider(BaseProvider):
             register_framework = self._register_framework
             
             def patched_load(self_reader, *args, **kwargs):
+                if not store.enabled:
+                    return original_load(self_reader, *args, **kwargs)
                 register_framework()
                 span = store.start_span("load_documents", kind="document")
                 try:
@@ -505,7 +500,8 @@ class LlamaIndexProvider(BaseProvider):
                             text=full_text
                         )
                         
-                        print(f"[SourcemapR] Document loaded: {filename} ({len(file_data['pages'])} pages)")
+                        if _DEBUG:
+                            print(f"[SourcemapR] Document loaded: {filename} ({len(file_data['pages'])} pages)")
                     
                     return result
                 except Exception as e:
@@ -526,6 +522,8 @@ class LlamaIndexProvider(BaseProvider):
             register_framework = self._register_framework
 
             def patched_load(self_reader, path, *args, **kwargs):
+                if not store.enabled:
+                    return original_load(self_reader, path, *args, **kwargs)
                 register_framework()
                 span = store.start_span("load_documents", kind="document")
                 try:
@@ -534,7 +532,6 @@ class LlamaIndexProvider(BaseProvider):
                     filepath = Path(path) if not isinstance(path, Path) else path
                     abs_path = os.path.abspath(filepath)
                     filename = filepath.name
-                    file_ext = filepath.suffix.lower()
 
                     # Inject file_name metadata into documents for chunk linking
                     for doc in result:
@@ -548,10 +545,8 @@ class LlamaIndexProvider(BaseProvider):
 
                     # For HTML files: Use loader's text directly (so chunk indices match for highlighting)
                     # But also parse HTML to get page positions for page number detection
-                    if file_ext in ('.htm', '.html', '.xhtml'):
+                    if filename.lower().endswith(HTML_EXTENSIONS):
                         try:
-                            from sourcemapr.utils.html_parser import HTMLParser
-
                             # Get the loader's extracted text (what the splitter will see)
                             loader_text = "\n\n".join([doc.text for doc in result])
 
@@ -574,16 +569,9 @@ class LlamaIndexProvider(BaseProvider):
                             if not hasattr(LlamaIndexProvider, '_html_page_positions'):
                                 LlamaIndexProvider._html_page_positions = {}
 
-                            if html_text_len > 0:
-                                scale = loader_text_len / html_text_len
-                                scaled_positions = {}
-                                for page_num, (start, end) in parser.page_positions.items():
-                                    scaled_start = int(start * scale)
-                                    scaled_end = int(end * scale)
-                                    scaled_positions[page_num] = (scaled_start, scaled_end)
-                                LlamaIndexProvider._html_page_positions[filename] = scaled_positions
-                            else:
-                                LlamaIndexProvider._html_page_positions[filename] = {1: (0, loader_text_len)}
+                            LlamaIndexProvider._html_page_positions[filename] = scale_page_positions(
+                                parser.page_positions, html_text_len, loader_text_len
+                            )
 
                             store.end_span(span, attributes={
                                 "num_files": 1,
@@ -606,7 +594,8 @@ class LlamaIndexProvider(BaseProvider):
                                 text=loader_text
                             )
 
-                            print(f"[SourcemapR] FlatReader loaded HTML: {filename} ({page_count} pages, {len(loader_text):,} chars)")
+                            if _DEBUG:
+                                print(f"[SourcemapR] FlatReader loaded HTML: {filename} ({page_count} pages, {len(loader_text):,} chars)")
                             return result
 
                         except Exception as e:
@@ -636,7 +625,8 @@ class LlamaIndexProvider(BaseProvider):
                         text=parsed_text
                         )
                     
-                    print(f"[SourcemapR] FlatReader loaded: {filename} ({len(result)} docs, path: {abs_path})")
+                    if _DEBUG:
+                        print(f"[SourcemapR] FlatReader loaded: {filename} ({len(result)} docs, path: {abs_path})")
                     return result
                 except Exception as e:
                     store.end_span(span, status="error")
@@ -659,6 +649,8 @@ class LlamaIndexProvider(BaseProvider):
             original_parse = NodeParser.get_nodes_from_documents
 
             def patched_parse(self_parser, documents, *args, **kwargs):
+                if not store.enabled:
+                    return original_parse(self_parser, documents, *args, **kwargs)
                 parser_name = self_parser.__class__.__name__
                 span = store.start_span("chunk_documents", kind="chunking")
                 try:
@@ -678,6 +670,13 @@ class LlamaIndexProvider(BaseProvider):
 
                     # First pass: collect all chunk data in order
                     all_chunk_data = []
+                    # Nodes share a handful of documents; check each path once
+                    is_html_by_doc = {}
+                    # Position -> page lookups and chunk locators, built once per HTML document
+                    page_lookups = {}
+                    html_locators = {}
+                    # HTML documents whose position mapping failed; skipped for the rest of this parse
+                    unmappable_html = set()
 
                     for i, node in enumerate(result):
                         doc_id = _get_node_doc_id(
@@ -692,30 +691,37 @@ class LlamaIndexProvider(BaseProvider):
                         start_char_idx = getattr(node, 'start_char_idx', None)
                         end_char_idx = getattr(node, 'end_char_idx', None)
                         if page_number is None and doc_id and doc_id in html_page_positions and start_char_idx is not None:
-                            page_number = _get_page_for_position(start_char_idx, html_page_positions[doc_id])
+                            page_for = page_lookups.get(doc_id)
+                            if page_for is None:
+                                page_for = page_lookups[doc_id] = build_page_lookup(html_page_positions[doc_id])
+                            page_number = page_for(start_char_idx)
 
                         # Calculate HTML indices for Original view highlighting
                         html_start_idx = None
                         html_end_idx = None
-                        file_path = source_file_paths.get(doc_id, '')
-                        file_ext = file_path.lower().split('.')[-1] if file_path else ''
-                        if file_ext in ('htm', 'html', 'xhtml') and doc_id in LlamaIndexProvider._raw_html_content:
+                        is_html = is_html_by_doc.get(doc_id)
+                        if is_html is None:
+                            is_html = is_html_by_doc[doc_id] = source_file_paths.get(doc_id, '').lower().endswith(HTML_EXTENSIONS)
+                        if is_html and doc_id in LlamaIndexProvider._raw_html_content and doc_id not in unmappable_html:
                             try:
-                                from sourcemapr.utils.html_text_extractor import get_html_positions_for_chunk
-                                raw_html = LlamaIndexProvider._raw_html_content[doc_id]
                                 loader_text = LlamaIndexProvider._loader_text.get(doc_id, '')
 
                                 # Use position-tracking extractor for accurate mapping
                                 if start_char_idx is not None and loader_text:
-                                    html_start_idx, html_end_idx = get_html_positions_for_chunk(
-                                        raw_html,
+                                    locator = html_locators.get(doc_id)
+                                    if locator is None:
+                                        locator = html_locators[doc_id] = HTMLChunkLocator(
+                                            LlamaIndexProvider._raw_html_content[doc_id]
+                                        )
+                                    html_start_idx, html_end_idx = locator.get_positions(
                                         loader_text,
                                         start_char_idx,
                                         end_char_idx or start_char_idx + len(node.text)
                                     )
-                            except Exception:
-                                # Silently continue if position mapping fails
-                                pass
+                            except Exception as e:
+                                # Report once and stop retrying this document's chunks
+                                unmappable_html.add(doc_id)
+                                print(f"[SourcemapR] Warning: HTML position mapping failed for {doc_id}: {e}")
 
                         if doc_id:
                             if doc_id not in chunks_by_doc:
@@ -773,7 +779,8 @@ class LlamaIndexProvider(BaseProvider):
 
                     _build_html_parsed_text(chunks_by_doc, source_file_paths, store, html_page_positions)
 
-                    print(f"[SourcemapR] {parser_name}: {len(result)} chunks created")
+                    if _DEBUG:
+                        print(f"[SourcemapR] {parser_name}: {len(result)} chunks created")
                     return result
                 except Exception as e:
                     store.end_span(span, status="error")
@@ -804,6 +811,8 @@ class LlamaIndexProvider(BaseProvider):
             store = self.store
             
             def patched_get_base(self_parser, nodes, *args, **kwargs):
+                if not store.enabled:
+                    return original_get_base(self_parser, nodes, *args, **kwargs)
                 # Extract filename from source nodes for linking
                 source_filename = None
                 for node in nodes:
@@ -858,7 +867,8 @@ class LlamaIndexProvider(BaseProvider):
                         text=parsed_text
                     )
                 
-                print(f"[SourcemapR] UnstructuredElementNodeParser: {len(base_nodes)} base nodes, {len(node_mappings)} table mappings")
+                if _DEBUG:
+                    print(f"[SourcemapR] UnstructuredElementNodeParser: {len(base_nodes)} base nodes, {len(node_mappings)} table mappings")
                 return base_nodes, node_mappings
             
             patched_get_base._sourcemapr_patched = True
@@ -877,6 +887,8 @@ class LlamaIndexProvider(BaseProvider):
             
             @classmethod
             def patched_from_docs(cls, documents, *args, **kwargs):
+                if not store.enabled:
+                    return original_from_docs(cls, documents, *args, **kwargs)
                 span = store.start_span("create_index", kind="indexing")
                 try:
                     result = original_from_docs(cls, documents, *args, **kwargs)
@@ -899,6 +911,8 @@ class LlamaIndexProvider(BaseProvider):
             store = self.store
             
             def patched_embed(self_emb, text, *args, **kwargs):
+                if not store.enabled:
+                    return original_embed(self_emb, text, *args, **kwargs)
                 start = time.time()
                 result = original_embed(self_emb, text, *args, **kwargs)
                 duration = (time.time() - start) * 1000
@@ -57,6 +57,8 @@ class OpenAIProvider(BaseProvider):
             store = self.store
 
             def patched_create(self_client, *args, **kwargs):
+                if not store.enabled:
+                    return original_create(self_client, *args, **kwargs)
                 start = time.time()
                 messages = kwargs.get('messages', [])
                 model = kwargs.get('model', 'unknown')
@@ -142,6 +144,8 @@ class OpenAIProvider(BaseProvider):
                 original_chat = openai.ChatCompletion.create
 
                 def patched_chat(*args, **kwargs):
+                    if not store.enabled:
+                        return original_chat(*args, **kwargs)
                     start = time.time()
                     messages = kwargs.get('messages', [])
                     model = kwargs.get('model', 'unknown')
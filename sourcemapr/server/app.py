@@ -2,7 +2,11 @@
 SourcemapR - RAG Observability Platform - FastAPI Server
 """
 
+import asyncio
 import json
+import os
+import queue
+import threading
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, List
@@ -14,9 +18,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 
+try:
+    import orjson  # Optional: pip install sourcemapr[fast]
+except ImportError:
+    orjson = None
+
 # Import database functions
 from sourcemapr.server import database as db
 
+# Per-event ingest logging is off by default; set SOURCEMAPR_DEBUG=1 to enable it
+_DEBUG = bool(os.environ.get("SOURCEMAPR_DEBUG"))
+
 app = FastAPI(title="SourcemapR - RAG Observability Platform")
 
 # Mount static files
@@ -43,12 +55,39 @@ app.add_middleware(
 )
 
 
+async def _read_json(request: Request):
+    """Parse a JSON request body, with orjson when it is installed."""
+    body = await request.body()
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _json_response(content):
+    """Serialize a large payload with orjson, skipping FastAPI's encoder pass.
+
+    Falls back to returning the content as-is for the default JSON response.
+    """
+    if orjson is None:
+        return content
+    return Response(
+        content=orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS),
+        media_type="application/json",
+    )
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup."""
     db.init_db()
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write out any trace events still queued."""
+    await asyncio.to_thread(_stop_ingest_writer)
+
+
 @app.middleware("http")
 async def ensure_db_middleware(request: Request, call_next):
     """Ensure database tables exist before processing requests."""
@@ -138,6 +177,7 @@ async def update_experiment(exp_id: int, exp: ExperimentUpdate):
 @app.delete("/api/experiments/{exp_id}")
 async def delete_experiment(exp_id: int):
     """Delete an experiment."""
+    await _wait_for_ingest()
     success = db.delete_experiment(exp_id)
     if not success:
         return {"error": "Experiment not found"}
@@ -147,6 +187,7 @@ async def delete_experiment(exp_id: int):
 @app.post("/api/experiments/{exp_id}/assign")
 async def assign_to_experiment(exp_id: int, req: AssignmentRequest):
     """Assign traces/docs to an experiment."""
+    await _wait_for_ingest()
     count = db.assign_to_experiment(
         exp_id,
         trace_ids=req.trace_ids,
@@ -160,6 +201,7 @@ async def assign_to_experiment(exp_id: int, req: AssignmentRequest):
 @app.post("/api/experiments/{exp_id}/unassign")
 async def unassign_from_experiment(exp_id: int, req: AssignmentRequest):
     """Remove items from an experiment."""
+    await _wait_for_ingest()
     count = db.unassign_from_experiment(
         trace_ids=req.trace_ids,
         doc_ids=req.doc_ids,
@@ -174,28 +216,94 @@ async def unassign_from_experiment(exp_id: int, req: AssignmentRequest):
 @app.post("/api/traces")
 async def receive_trace(request: Request):
     """Receive trace data from the observability library."""
-    data = await request.json()
+    data = await _read_json(request)
     event_type = data.get('type')
 
     # Handle batch events (multiple items in one request)
     if event_type == 'batch':
         items = data.get('items', [])
-        print(f"[SourcemapR] Received batch: {len(items)} items")
-        _process_batch(items)
-        return {"status": "ok", "processed": len(items)}
-
-    # Debug logging for non-batch
-    print(f"[SourcemapR] Received event: {event_type}")
-    _process_event(data)
+        if _DEBUG:
+            print(f"[SourcemapR] Received batch: {len(items)} items")
+        await _queue_ingest(('batch', items))
+        return {"status": "ok", "queued": len(items)}
+
+    if _DEBUG:
+        print(f"[SourcemapR] Received event: {event_type}")
+    await _queue_ingest(('event', data))
     return {"status": "ok"}
 
 
+# Trace events are written by one background thread so ingest requests return
+# without waiting on SQLite; a full queue makes requests wait (backpressure)
+MAX_QUEUED_INGESTS = 1000
+
+_ingest_queue: queue.Queue = queue.Queue(maxsize=MAX_QUEUED_INGESTS)
+_ingest_thread: Optional[threading.Thread] = None
+_ingest_lock = threading.Lock()
+
+
+async def _queue_ingest(entry: tuple):
+    """Hand an ('event', data) or ('batch', items) entry to the writer thread."""
+    _start_ingest_writer()
+    try:
+        _ingest_queue.put_nowait(entry)
+    except queue.Full:
+        await asyncio.to_thread(_ingest_queue.put, entry)
+
+
+async def _wait_for_ingest():
+    """Wait until every trace event accepted so far has been written."""
+    await asyncio.to_thread(_ingest_queue.join)
+
+
+def _start_ingest_writer():
+    global _ingest_thread
+    if _ingest_thread is not None:
+        return
+    with _ingest_lock:
+        if _ingest_thread is None:
+            _ingest_thread = threading.Thread(
+                target=_ingest_loop, name="sourcemapr-ingest", daemon=True
+            )
+            _ingest_thread.start()
+
+
+def _stop_ingest_writer():
+    """Drain the queue and stop the writer thread."""
+    global _ingest_thread
+    with _ingest_lock:
+        thread, _ingest_thread = _ingest_thread, None
+    if thread is not None:
+        _ingest_queue.put(None)
+        thread.join()
+
+
+def _ingest_loop():
+    """Apply queued trace events in arrival order."""
+    while True:
+        entry = _ingest_queue.get()
+        try:
+            if entry is None:
+                return
+            kind, payload = entry
+            if kind == 'batch':
+                _process_batch(payload)
+            else:
+                _process_event(payload)
+        except Exception as e:
+            print(f"[SourcemapR] Error storing trace data: {e}")
+        finally:
+            _ingest_queue.task_done()
+
+
 def _process_batch(items: list):
     """Process a batch of events efficiently."""
     # Group items by type for bulk processing
     chunks = []
     documents = []
     parsed = []
+    spans = []
+    embeddings = []
     other = []
 
     for item in items:
@@ -206,6 +314,10 @@ def _process_batch(items: list):
             documents.append(item)
         elif event_type == 'parsed':
             parsed.append(item)
+        elif event_type in ('span_start', 'span_end'):
+            spans.append(item)
+        elif event_type == 'embedding':
+            embeddings.append(item)
         else:
             other.append(item)
 
@@ -221,42 +333,60 @@ def _process_batch(items: list):
     if parsed:
         db.store_parsed_batch(parsed)
 
+    # Bulk insert spans (start/end events for a span stay in order)
+    if spans:
+        db.store_spans_batch(spans)
+
+    # Bulk insert embeddings
+    if embeddings:
+        db.store_embeddings_batch(embeddings)
+
     # Process other items individually
     for item in other:
         _process_event(item)
 
 
+def _store_pipeline_stage(data: dict):
+    """Store a pipeline stage and the chunks it carries."""
+    stage_data = data.get('data', {})
+    chunks = stage_data.pop('chunks', [])
+    db.store_pipeline_stage(data)
+    if chunks:
+        db.store_stage_chunks_batch(stage_data.get('stage_id'), chunks)
+
+
+# Event type -> storage handler
+_EVENT_HANDLERS = {
+    'trace': db.store_trace,
+    'span_start': db.store_span,
+    'span_end': db.store_span,
+    'document': db.store_document,
+    'parsed': db.store_parsed,
+    'chunk': db.store_chunk,
+    'embedding': db.store_embedding,
+    'retrieval': db.store_retrieval,
+    'llm': db.store_llm_call,
+    'pipeline': db.store_pipeline,
+    'pipeline_stage': _store_pipeline_stage,
+}
+
+
 def _process_event(data: dict):
     """Process a single event."""
     event_type = data.get('type')
+    handler = _EVENT_HANDLERS.get(event_type)
+    if handler is None:
+        return
+    handler(data)
 
-    if event_type == 'trace':
-        db.store_trace(data)
-    elif event_type in ('span_start', 'span_end'):
-        db.store_span(data)
-    elif event_type == 'document':
-        db.store_document(data)
-    elif event_type == 'parsed':
-        db.store_parsed(data)
-    elif event_type == 'chunk':
-        db.store_chunk(data)
-    elif event_type == 'embedding':
-        db.store_embedding(data)
-    elif event_type == 'retrieval':
-        print(f"[SourcemapR] Retrieval data: {data.get('data', {}).get('query', 'N/A')[:50]}")
-        db.store_retrieval(data)
-    elif event_type == 'llm':
-        print(f"[SourcemapR] LLM call: {data.get('data', {}).get('model', 'N/A')}")
-        db.store_llm_call(data)
-    elif event_type == 'pipeline':
-        db.store_pipeline(data)
-    elif event_type == 'pipeline_stage':
-        stage_data = data.get('data', {})
-        chunks = stage_data.pop('chunks', [])
-        db.store_pipeline_stage(data)
-        if chunks:
-            db.store_stage_chunks_batch(stage_data.get('stage_id'), chunks)
-        print(f"[SourcemapR] Pipeline stage: {stage_data.get('stage_name')} ({stage_data.get('input_count', 0)} → {stage_data.get('output_count', 0)})")
+    if _DEBUG:
+        event_data = data.get('data', {})
+        if event_type == 'retrieval':
+            print(f"[SourcemapR] Retrieval data: {event_data.get('query', 'N/A')[:50]}")
+        elif event_type == 'llm':
+            print(f"[SourcemapR] LLM call: {event_data.get('model', 'N/A')}")
+        elif event_type == 'pipeline_stage':
+            print(f"[SourcemapR] Pipeline stage: {event_data.get('stage_name')} ({event_data.get('input_count', 0)} → {event_data.get('output_count', 0)})")
 
 
 # ========== Data Retrieval Endpoints ==========
@@ -279,31 +409,43 @@ async def get_parsed_for_doc(doc_id: str):
 @app.get("/api/data")
 async def get_all_data(experiment_id: Optional[int] = Query(None)):
     """Get all data for the dashboard (lightweight - no parsed text)."""
-    traces = db.get_traces(experiment_id)
-    spans = db.get_spans()
-    # Only get chunk metadata, not full text (for performance)
-    chunks = db.get_chunks(experiment_id=experiment_id, include_text=True, limit=500)
-
-    # Get documents that have chunks in this experiment (not filtered by experiment_id)
-    # This handles the case where documents were logged in one experiment but chunks in another
-    if experiment_id and chunks:
-        doc_ids_with_chunks = set(c.get('doc_id') for c in chunks.values() if c.get('doc_id'))
-        all_documents = db.get_documents()  # Get all documents
-        documents = {k: v for k, v in all_documents.items() if v.get('doc_id') in doc_ids_with_chunks}
-    else:
-        documents = db.get_documents(experiment_id)
+
+    def get_chunks_and_documents():
+        # Only get chunk metadata, not full text (for performance)
+        chunks = db.get_chunks(experiment_id=experiment_id, include_text=True, limit=500)
+
+        # Get documents that have chunks in this experiment (not filtered by experiment_id)
+        # This handles the case where documents were logged in one experiment but chunks in another
+        if experiment_id and chunks:
+            doc_ids_with_chunks = set(c.get('doc_id') for c in chunks.values() if c.get('doc_id'))
+            all_documents = db.get_documents()  # Get all documents
+            documents = {k: v for k, v in all_documents.items() if v.get('doc_id') in doc_ids_with_chunks}
+        else:
+            documents = db.get_documents(experiment_id)
+        return chunks, documents
+
+    # Each query opens its own connection, so they run side by side in worker
+    # threads instead of one after another on the event loop
+    (
+        traces, spans, (chunks, documents), embeddings, retrievals,
+        llm_calls, stats, experiments, evaluations, categories,
+    ) = await asyncio.gather(
+        asyncio.to_thread(db.get_traces, experiment_id),
+        asyncio.to_thread(db.get_spans),
+        asyncio.to_thread(get_chunks_and_documents),
+        asyncio.to_thread(db.get_embeddings, limit=100),
+        asyncio.to_thread(db.get_retrievals, experiment_id, limit=50),
+        asyncio.to_thread(db.get_llm_calls, experiment_id, limit=50),
+        asyncio.to_thread(db.get_stats, experiment_id),
+        asyncio.to_thread(db.get_experiments),
+        asyncio.to_thread(db.get_evaluations, experiment_id=experiment_id),
+        asyncio.to_thread(db.get_query_categories),
+    )
 
     # Don't load parsed docs here - load lazily per document
     parsed = {}
-    embeddings = db.get_embeddings(limit=100)
-    retrievals = db.get_retrievals(experiment_id, limit=50)
-    llm_calls = db.get_llm_calls(experiment_id, limit=50)
-    stats = db.get_stats(experiment_id)
-    experiments = db.get_experiments()
-    evaluations = db.get_evaluations(experiment_id=experiment_id)
-    categories = db.get_query_categories()
 
-    return {
+    return _json_response({
         "traces": traces,
         "spans": spans,
         "documents": documents,
@@ -316,7 +458,7 @@ async def get_all_data(experiment_id: Optional[int] = Query(None)):
         "experiments": experiments,
         "evaluations": evaluations,
         "categories": categories
-    }
+    })
 
 
 @app.get("/api/traces")
@@ -422,6 +564,8 @@ async def get_retrieval_pipeline(retrieval_id: str):
 @app.post("/api/clear")
 async def clear_data(experiment_id: Optional[int] = Query(None), reset: bool = Query(False)):
     """Clear all data or data for a specific experiment."""
+    # Events queued before the clear must not reappear after it
+    await _wait_for_ingest()
     if experiment_id:
         db.clear_experiment_data(experiment_id)
         return {"status": "cleared", "experiment_id": experiment_id}
@@ -452,7 +596,7 @@ async def get_evaluations_list(
 @app.post("/api/evaluations")
 async def create_evaluation(request: Request):
     """Create a new evaluation."""
-    data = await request.json()
+    data = await _read_json(request)
     evaluation_id = db.store_evaluation(data)
     return {"evaluation_id": evaluation_id, "status": "created"}
 
@@ -469,7 +613,7 @@ async def get_evaluation_detail(evaluation_id: str):
 @app.put("/api/evaluations/{evaluation_id}")
 async def update_evaluation_endpoint(evaluation_id: str, request: Request):
     """Update an existing evaluation."""
-    updates = await request.json()
+    updates = await _read_json(request)
     success = db.update_evaluation(evaluation_id, updates)
     if not success:
         return {"error": "Evaluation not found or no updates provided"}
@@ -502,7 +646,7 @@ async def get_categories_summary():
 @app.post("/api/categories")
 async def create_category(request: Request):
     """Add a category to a query/retrieval."""
-    data = await request.json()
+    data = await _read_json(request)
     success = db.add_query_category(
         retrieval_id=data.get('retrieval_id'),
         category=data.get('category'),
@@ -526,6 +670,18 @@ async def delete_category(retrieval_id: str, category: str):
 
 # ========== File Serving ==========
 
+# Security: only these file types are served, with proper media types
+FILE_MEDIA_TYPES = {
+    '.pdf': 'application/pdf',
+    '.txt': 'text/plain',
+    '.md': 'text/markdown',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.doc': 'application/msword',
+    '.htm': 'text/html',
+    '.html': 'text/html',
+}
+
+
 @app.get("/api/files/{file_path:path}")
 async def get_original_file(file_path: str):
     """Serve original document files (PDFs, etc.)."""
@@ -536,30 +692,15 @@ async def get_original_file(file_path: str):
     if not file.exists():
         return {"error": "File not found"}
 
-    # Security: only allow certain file types and set proper media types
-    media_types = {
-        '.pdf': 'application/pdf',
-        '.txt': 'text/plain',
-        '.md': 'text/markdown',
-        '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        '.doc': 'application/msword',
-        '.htm': 'text/html',
-        '.html': 'text/html',
-    }
-
-    ext = file.suffix.lower()
-    if ext not in media_types:
+    media_type = FILE_MEDIA_TYPES.get(file.suffix.lower())
+    if media_type is None:
         return {"error": "File type not allowed"}
 
-    # Read file and return with inline content disposition
-    content = file.read_bytes()
-    return Response(
-        content=content,
-        media_type=media_types[ext],
-        headers={
-            "Content-Disposition": "inline",
-            "Content-Length": str(len(content))
-        }
+    # Stream from disk with inline content disposition (size and range handled by FileResponse)
+    return FileResponse(
+        path=str(file),
+        media_type=media_type,
+        headers={"Content-Disposition": "inline"},
     )
 
 
@@ -3,21 +3,53 @@ SQLite Database Layer for SourcemapR - RAG Observability Platform.
 Provides persistent storage for experiments, traces, documents, and all observability data.
 """
 
+import atexit
+import os
 import sqlite3
 import json
+import threading
 from pathlib import Path
 from datetime import datetime
 from contextlib import contextmanager
 from typing import Dict, List, Any, Optional
 
+try:
+    import orjson  # Optional: pip install sourcemapr[fast]
+except ImportError:
+    orjson = None
+
 DB_PATH = Path(__file__).parent / "observability.db"
 
+# Applied to every new connection (journal_mode=WAL is stored in the file by init_db)
+CONNECTION_PRAGMAS = (
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+# One open connection per thread, reused across get_db() calls
+_local = threading.local()
+# Open per-thread connections by owning thread, so they can be closed at exit
+_connections: Dict[threading.Thread, sqlite3.Connection] = {}
+_connections_lock = threading.Lock()
+# Database file whose tables ensure_tables_exist() last confirmed
+_verified_db_key = None
+_verify_lock = threading.Lock()
+
 
 def init_db():
     """Initialize database with schema."""
     with get_db() as conn:
         cursor = conn.cursor()
 
+        # Larger pages suit the text-heavy rows; only takes effect on a new,
+        # empty database, so it must run before WAL is enabled
+        cursor.execute("PRAGMA page_size=8192")
+        # WAL lets the dashboard read while traces are being written
+        cursor.execute("PRAGMA journal_mode=WAL")
+
         # Experiments table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS experiments (
@@ -51,10 +83,11 @@ def init_db():
             )
         """)
 
-        # Spans table
+        # Spans table (plain INTEGER PRIMARY KEY: rows are looked up by span_id,
+        # so AUTOINCREMENT's sqlite_sequence write on every insert buys nothing)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS spans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id INTEGER PRIMARY KEY,
                 span_id TEXT UNIQUE NOT NULL,
                 trace_id TEXT,
                 parent_id TEXT,
@@ -104,7 +137,7 @@ def init_db():
         # Chunks table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS chunks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id INTEGER PRIMARY KEY,
                 chunk_id TEXT UNIQUE NOT NULL,
                 doc_id TEXT,
                 experiment_id INTEGER,
@@ -155,7 +188,7 @@ def init_db():
         # Embeddings table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS embeddings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id INTEGER PRIMARY KEY,
                 chunk_id TEXT,
                 model TEXT,
                 dimensions INTEGER,
@@ -245,7 +278,7 @@ def init_db():
         # Stage chunks table - tracks chunks at each stage
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS stage_chunks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id INTEGER PRIMARY KEY,
                 stage_id TEXT,
                 chunk_id TEXT,
                 doc_id TEXT,
@@ -297,13 +330,25 @@ def init_db():
         """)
 
         # Create indexes for common queries
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_traces_experiment ON traces(experiment_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_experiment ON documents(experiment_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc ON chunks(doc_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_experiment ON chunks(experiment_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_spans_trace ON spans(trace_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_retrievals_experiment ON retrievals(experiment_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_experiment ON llm_calls(experiment_id)")
+        # Experiments are looked up by name on every store; names are not unique
+        # (the API allows duplicates), so this is a plain index
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_experiments_name ON experiments(name)")
+        # List queries filter on experiment (or trace) and sort by newest first;
+        # composite indexes serve both, replacing the single-column ones
+        cursor.execute("DROP INDEX IF EXISTS idx_traces_experiment")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_traces_experiment_time ON traces(experiment_id, created_at DESC)")
+        cursor.execute("DROP INDEX IF EXISTS idx_documents_experiment")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_experiment_time ON documents(experiment_id, created_at DESC)")
+        cursor.execute("DROP INDEX IF EXISTS idx_chunks_doc")  # Superseded by idx_chunks_doc_index
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_index ON chunks(doc_id, index_num)")
+        cursor.execute("DROP INDEX IF EXISTS idx_chunks_experiment")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_experiment_time ON chunks(experiment_id, created_at DESC)")
+        cursor.execute("DROP INDEX IF EXISTS idx_spans_trace")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_spans_trace_time ON spans(trace_id, created_at DESC)")
+        cursor.execute("DROP INDEX IF EXISTS idx_retrievals_experiment")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_retrievals_experiment_time ON retrievals(experiment_id, created_at DESC)")
+        cursor.execute("DROP INDEX IF EXISTS idx_llm_calls_experiment")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_experiment_time ON llm_calls(experiment_id, created_at DESC)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_retrievals_retrieval_id ON retrievals(retrieval_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_retrieval_id ON llm_calls(retrieval_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_pipelines_experiment ON pipelines(experiment_id)")
@@ -328,28 +373,99 @@ def init_db():
         conn.commit()
 
 
+def _db_file_key():
+    """Identify the current database file, or None if it does not exist."""
+    try:
+        st = os.stat(DB_PATH)
+    except FileNotFoundError:
+        return None
+    return (str(DB_PATH), st.st_dev, st.st_ino)
+
+
+def _connect() -> sqlite3.Connection:
+    # This module issues well over the default 128 distinct statements; keep
+    # them all prepared for the life of the connection
+    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    with _connections_lock:
+        # Drop connections left behind by threads that have exited
+        for thread in [t for t in _connections if not t.is_alive()]:
+            _connections.pop(thread).close()
+        previous = _connections.pop(threading.current_thread(), None)
+        _connections[threading.current_thread()] = conn
+    if previous is not None:
+        previous.close()
+    return conn
+
+
+@atexit.register
+def close_all_connections() -> None:
+    """Close every thread's connection (checkpoints and removes the WAL file)."""
+    with _connections_lock:
+        conns = list(_connections.values())
+        _connections.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
 @contextmanager
 def get_db():
-    """Get database connection with row factory."""
-    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    """Get this thread's database connection with row factory.
+
+    The connection stays open between calls and is reopened if the database
+    file is deleted or replaced. Uncommitted changes are rolled back when the
+    outermost ``with get_db()`` block exits, as closing the connection did.
+    """
+    depth = getattr(_local, 'depth', 0)
+    conn = getattr(_local, 'conn', None)
+    if depth == 0:
+        key = _db_file_key()
+        if conn is None or key is None or key != _local.key:
+            conn = _connect()
+            _local.conn = conn
+            _local.key = _db_file_key()
+    _local.depth = depth + 1
     try:
         yield conn
     finally:
-        conn.close()
+        _local.depth = depth
+        if depth == 0 and conn.in_transaction:
+            conn.rollback()
+
+
+def _begin_write(conn: sqlite3.Connection) -> None:
+    """Take the write lock now, so reads and writes that follow are atomic."""
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
 
 
 def ensure_tables_exist():
-    """Ensure all tables exist, recreating them if needed."""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        # Check if traces table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='traces'")
-        if not cursor.fetchone():
-            print("[SourcemapR] Database tables missing, reinitializing...")
-            init_db()
-            return True
-    return False
+    """Ensure all tables exist, recreating them if needed.
+
+    Only checks the schema again once the database file is deleted or replaced.
+    """
+    global _verified_db_key
+    if _verified_db_key is not None and _db_file_key() == _verified_db_key:
+        return False
+    with _verify_lock:
+        if _verified_db_key is not None and _db_file_key() == _verified_db_key:
+            return False
+        reinitialized = False
+        with get_db() as conn:
+            cursor = conn.cursor()
+            # Check if traces table exists
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='traces'")
+            if not cursor.fetchone():
+                print("[SourcemapR] Database tables missing, reinitializing...")
+                init_db()
+                reinitialized = True
+        _verified_db_key = _db_file_key()
+    return reinitialized
 
 
 # ========== Experiment CRUD ==========
@@ -363,49 +479,65 @@ def create_experiment(name: str, description: str = None) -> Dict:
             (name, description)
         )
         conn.commit()
-        exp_id = cursor.lastrowid
-        return get_experiment(exp_id)
+        # A new experiment owns no data yet, so skip get_experiment()'s counts
+        cursor.execute("SELECT * FROM experiments WHERE id = ?", (cursor.lastrowid,))
+        experiment = dict(cursor.fetchone())
+        experiment.update(trace_count=0, doc_count=0, retrieval_count=0, llm_count=0)
+        return experiment
+
+
+def _get_or_create_experiment(cursor: sqlite3.Cursor, name: str, frameworks: List[str] = None) -> int:
+    """Get experiment ID by name, creating it if needed, in the caller's transaction."""
+    cursor.execute("SELECT id, framework FROM experiments WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    if row:
+        # Update framework if provided - REPLACE don't combine
+        if frameworks:
+            new_framework = ','.join(sorted(set(frameworks)))
+            existing = row['framework'] or ''
+            if new_framework != existing:
+                cursor.execute(
+                    "UPDATE experiments SET framework = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (new_framework, row['id'])
+                )
+        return row['id']
+    # Create new experiment with framework
+    framework_str = ','.join(sorted(set(frameworks))) if frameworks else None
+    cursor.execute(
+        "INSERT INTO experiments (name, framework) VALUES (?, ?)",
+        (name, framework_str)
+    )
+    return cursor.lastrowid
 
 
 def get_or_create_experiment_by_name(name: str, frameworks: List[str] = None) -> int:
     """Get experiment ID by name, creating it if it doesn't exist."""
     with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, framework FROM experiments WHERE name = ?", (name,))
-        row = cursor.fetchone()
-        if row:
-            # Update framework if provided - REPLACE don't combine
-            if frameworks:
-                new_framework = ','.join(sorted(set(frameworks)))
-                existing = row['framework'] or ''
-                if new_framework != existing:
-                    cursor.execute(
-                        "UPDATE experiments SET framework = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                        (new_framework, row['id'])
-                    )
-                    conn.commit()
-            return row['id']
-        # Create new experiment with framework
-        framework_str = ','.join(sorted(set(frameworks))) if frameworks else None
-        cursor.execute(
-            "INSERT INTO experiments (name, framework) VALUES (?, ?)",
-            (name, framework_str)
-        )
+        _begin_write(conn)
+        experiment_id = _get_or_create_experiment(conn.cursor(), name, frameworks)
         conn.commit()
-        return cursor.lastrowid
+        return experiment_id
 
 
-# Cache for default experiment ID to avoid nested connections
+# Default experiment's ID, filled by _experiment_id_for() only once the row
+# is committed; reset by clear_all_data() and reset_all_data()
 _default_experiment_id_cache: Optional[int] = None
 
 
-def get_default_experiment_id() -> int:
-    """Get or create the Default experiment and return its ID. Uses caching to avoid nested connections."""
+def _experiment_id_for(cursor: sqlite3.Cursor, payload: Dict) -> int:
+    """Resolve the experiment an event belongs to, in the caller's transaction."""
     global _default_experiment_id_cache
+    if payload.get('experiment_name'):
+        return _get_or_create_experiment(cursor, payload['experiment_name'], payload.get('frameworks'))
     if _default_experiment_id_cache is not None:
         return _default_experiment_id_cache
-    _default_experiment_id_cache = get_or_create_experiment_by_name("Default")
-    return _default_experiment_id_cache
+    cursor.execute("SELECT id FROM experiments WHERE name = ?", ("Default",))
+    row = cursor.fetchone()
+    if row:
+        # Only cache a committed row; a new one could still be rolled back
+        _default_experiment_id_cache = row['id']
+        return row['id']
+    return _get_or_create_experiment(cursor, "Default")
 
 
 def get_experiments() -> List[Dict]:
@@ -480,49 +612,51 @@ def delete_experiment(exp_id: int) -> bool:
 
 # ========== Assignment Functions ==========
 
+# Older SQLite builds allow at most 999 bound parameters per statement
+MAX_IN_PARAMS = 500
+
+
+def _update_where_in(cursor: sqlite3.Cursor, sql: str, params: list, ids: list) -> int:
+    """Run ``sql`` (ending in ``IN ({})``) over ``ids`` in slices. Returns rows changed."""
+    count = 0
+    for start in range(0, len(ids), MAX_IN_PARAMS):
+        batch = ids[start:start + MAX_IN_PARAMS]
+        cursor.execute(sql.format(','.join('?' * len(batch))), params + batch)
+        count += cursor.rowcount
+    return count
+
+
 def assign_to_experiment(exp_id: int, trace_ids: List[str] = None, doc_ids: List[str] = None,
                          retrieval_ids: List[int] = None, llm_ids: List[int] = None) -> int:
     """Assign items to an experiment. Returns count of updated items."""
     count = 0
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
 
         if trace_ids:
-            placeholders = ','.join('?' * len(trace_ids))
-            cursor.execute(
-                f"UPDATE traces SET experiment_id = ? WHERE trace_id IN ({placeholders})",
-                [exp_id] + trace_ids
+            count += _update_where_in(
+                cursor, "UPDATE traces SET experiment_id = ? WHERE trace_id IN ({})", [exp_id], trace_ids
             )
-            count += cursor.rowcount
 
         if doc_ids:
-            placeholders = ','.join('?' * len(doc_ids))
-            cursor.execute(
-                f"UPDATE documents SET experiment_id = ? WHERE doc_id IN ({placeholders})",
-                [exp_id] + doc_ids
+            count += _update_where_in(
+                cursor, "UPDATE documents SET experiment_id = ? WHERE doc_id IN ({})", [exp_id], doc_ids
             )
-            count += cursor.rowcount
             # Also update chunks for these docs
-            cursor.execute(
-                f"UPDATE chunks SET experiment_id = ? WHERE doc_id IN ({placeholders})",
-                [exp_id] + doc_ids
+            _update_where_in(
+                cursor, "UPDATE chunks SET experiment_id = ? WHERE doc_id IN ({})", [exp_id], doc_ids
             )
 
         if retrieval_ids:
-            placeholders = ','.join('?' * len(retrieval_ids))
-            cursor.execute(
-                f"UPDATE retrievals SET experiment_id = ? WHERE id IN ({placeholders})",
-                [exp_id] + retrieval_ids
+            count += _update_where_in(
+                cursor, "UPDATE retrievals SET experiment_id = ? WHERE id IN ({})", [exp_id], retrieval_ids
             )
-            count += cursor.rowcount
 
         if llm_ids:
-            placeholders = ','.join('?' * len(llm_ids))
-            cursor.execute(
-                f"UPDATE llm_calls SET experiment_id = ? WHERE id IN ({placeholders})",
-                [exp_id] + llm_ids
+            count += _update_where_in(
+                cursor, "UPDATE llm_calls SET experiment_id = ? WHERE id IN ({})", [exp_id], llm_ids
             )
-            count += cursor.rowcount
 
         conn.commit()
     return count
@@ -534,42 +668,30 @@ def unassign_from_experiment(trace_ids: List[str] = None, doc_ids: List[str] = N
     count = 0
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
 
         if trace_ids:
-            placeholders = ','.join('?' * len(trace_ids))
-            cursor.execute(
-                f"UPDATE traces SET experiment_id = NULL WHERE trace_id IN ({placeholders})",
-                trace_ids
+            count += _update_where_in(
+                cursor, "UPDATE traces SET experiment_id = NULL WHERE trace_id IN ({})", [], trace_ids
             )
-            count += cursor.rowcount
 
         if doc_ids:
-            placeholders = ','.join('?' * len(doc_ids))
-            cursor.execute(
-                f"UPDATE documents SET experiment_id = NULL WHERE doc_id IN ({placeholders})",
-                doc_ids
+            count += _update_where_in(
+                cursor, "UPDATE documents SET experiment_id = NULL WHERE doc_id IN ({})", [], doc_ids
             )
-            count += cursor.rowcount
-            cursor.execute(
-                f"UPDATE chunks SET experiment_id = NULL WHERE doc_id IN ({placeholders})",
-                doc_ids
+            _update_where_in(
+                cursor, "UPDATE chunks SET experiment_id = NULL WHERE doc_id IN ({})", [], doc_ids
             )
 
         if retrieval_ids:
-            placeholders = ','.join('?' * len(retrieval_ids))
-            cursor.execute(
-                f"UPDATE retrievals SET experiment_id = NULL WHERE id IN ({placeholders})",
-                retrieval_ids
+            count += _update_where_in(
+                cursor, "UPDATE retrievals SET experiment_id = NULL WHERE id IN ({})", [], retrieval_ids
             )
-            count += cursor.rowcount
 
         if llm_ids:
-            placeholders = ','.join('?' * len(llm_ids))
-            cursor.execute(
-                f"UPDATE llm_calls SET experiment_id = NULL WHERE id IN ({placeholders})",
-                llm_ids
+            count += _update_where_in(
+                cursor, "UPDATE llm_calls SET experiment_id = NULL WHERE id IN ({})", [], llm_ids
             )
-            count += cursor.rowcount
 
         conn.commit()
     return count
@@ -577,19 +699,44 @@ def unassign_from_experiment(trace_ids: List[str] = None, doc_ids: List[str] = N
 
 # ========== Data Storage Functions ==========
 
+# Payload fields that are also stored in a column of their own. They are left
+# out of the JSON 'data' copy and restored from the column when read back.
+CHUNK_COLUMN_FIELDS = frozenset({'text'})
+PARSED_COLUMN_FIELDS = frozenset({'text'})
+RETRIEVAL_COLUMN_FIELDS = frozenset({'results'})
+LLM_COLUMN_FIELDS = frozenset({'messages', 'prompt', 'response'})
+
+
+def _dump_payload(payload: Any, column_fields: frozenset = frozenset()) -> str:
+    """JSON-encode an event payload, skipping non-empty fields kept in columns."""
+    if column_fields:
+        payload = {k: v for k, v in payload.items() if k not in column_fields or not v}
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            pass  # e.g. non-string keys; the stdlib encoder accepts those
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def _load_payload(text: str) -> Any:
+    """Decode a stored JSON payload."""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN written by older versions; let the stdlib decide
+    return json.loads(text)
+
+
 def store_trace(data: Dict) -> None:
     """Store a trace."""
     trace_data = data.get('data', {})
-    frameworks = trace_data.get('frameworks')
-
-    # Get experiment_id BEFORE opening connection to avoid nested connections
-    if trace_data.get('experiment_name'):
-        experiment_id = get_or_create_experiment_by_name(trace_data['experiment_name'], frameworks)
-    else:
-        experiment_id = get_default_experiment_id()
 
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
+        experiment_id = _experiment_id_for(cursor, trace_data)
         cursor.execute("""
             INSERT OR REPLACE INTO traces (trace_id, experiment_id, name, start_time, end_time, data)
             VALUES (?, ?, ?, ?, ?, ?)
@@ -599,7 +746,7 @@ def store_trace(data: Dict) -> None:
             trace_data.get('name'),
             trace_data.get('start_time'),
             trace_data.get('end_time'),
-            json.dumps(trace_data)
+            _dump_payload(trace_data)
         ))
         conn.commit()
 
@@ -623,8 +770,8 @@ def store_span(data: Dict) -> None:
             span_data.get('end_time'),
             span_data.get('duration_ms'),
             span_data.get('status'),
-            json.dumps(span_data.get('attributes', {})),
-            json.dumps(span_data.get('events', []))
+            _dump_payload(span_data['attributes']) if span_data.get('attributes') else None,
+            _dump_payload(span_data['events']) if span_data.get('events') else None
         ))
         conn.commit()
 
@@ -632,16 +779,11 @@ def store_span(data: Dict) -> None:
 def store_document(data: Dict) -> None:
     """Store a document."""
     doc_data = data.get('data', {})
-    frameworks = doc_data.get('frameworks')
-
-    # Get experiment_id BEFORE opening connection to avoid nested connections
-    if doc_data.get('experiment_name'):
-        experiment_id = get_or_create_experiment_by_name(doc_data['experiment_name'], frameworks)
-    else:
-        experiment_id = get_default_experiment_id()
 
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
+        experiment_id = _experiment_id_for(cursor, doc_data)
         cursor.execute("""
             INSERT OR REPLACE INTO documents
             (doc_id, experiment_id, filename, file_path, num_pages, text_length, trace_id, data)
@@ -654,7 +796,7 @@ def store_document(data: Dict) -> None:
             doc_data.get('num_pages'),
             doc_data.get('text_length'),
             doc_data.get('trace_id'),
-            json.dumps(doc_data)
+            _dump_payload(doc_data)
         ))
         conn.commit()
 
@@ -674,7 +816,7 @@ def store_parsed(data: Dict) -> None:
             parsed_data.get('text'),
             parsed_data.get('text_length'),
             parsed_data.get('trace_id'),
-            json.dumps(parsed_data)
+            _dump_payload(parsed_data, PARSED_COLUMN_FIELDS)
         ))
         conn.commit()
 
@@ -682,16 +824,11 @@ def store_parsed(data: Dict) -> None:
 def store_chunk(data: Dict) -> None:
     """Store a chunk."""
     chunk_data = data.get('data', {})
-    frameworks = chunk_data.get('frameworks')
-
-    # Get experiment_id BEFORE opening connection to avoid nested connections
-    if chunk_data.get('experiment_name'):
-        experiment_id = get_or_create_experiment_by_name(chunk_data['experiment_name'], frameworks)
-    else:
-        experiment_id = get_default_experiment_id()
 
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
+        experiment_id = _experiment_id_for(cursor, chunk_data)
         cursor.execute("""
             INSERT OR REPLACE INTO chunks
             (chunk_id, doc_id, experiment_id, index_num, text, text_length, page_number, start_char_idx, end_char_idx, html_start_idx, html_end_idx, prev_anchor, next_anchor, metadata, trace_id, data)
@@ -712,7 +849,7 @@ def store_chunk(data: Dict) -> None:
             chunk_data.get('next_anchor'),
             json.dumps(chunk_data.get('metadata', {})),
             chunk_data.get('trace_id'),
-            json.dumps(chunk_data)
+            _dump_payload(chunk_data, CHUNK_COLUMN_FIELDS)
         ))
         conn.commit()
 
@@ -732,7 +869,7 @@ def store_embedding(data: Dict) -> None:
             emb_data.get('dimensions'),
             emb_data.get('duration_ms'),
             emb_data.get('trace_id'),
-            json.dumps(emb_data)
+            _dump_payload(emb_data)
         ))
         conn.commit()
 
@@ -740,16 +877,11 @@ def store_embedding(data: Dict) -> None:
 def store_retrieval(data: Dict) -> None:
     """Store a retrieval record."""
     ret_data = data.get('data', {})
-    frameworks = ret_data.get('frameworks')
-
-    # Get experiment_id BEFORE opening connection to avoid nested connections
-    if ret_data.get('experiment_name'):
-        experiment_id = get_or_create_experiment_by_name(ret_data['experiment_name'], frameworks)
-    else:
-        experiment_id = get_default_experiment_id()
 
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
+        experiment_id = _experiment_id_for(cursor, ret_data)
         cursor.execute("""
             INSERT INTO retrievals
             (experiment_id, query, results, num_results, duration_ms, trace_id, retrieval_id, data)
@@ -762,7 +894,7 @@ def store_retrieval(data: Dict) -> None:
             ret_data.get('duration_ms'),
             ret_data.get('trace_id'),
             ret_data.get('retrieval_id'),
-            json.dumps(ret_data)
+            _dump_payload(ret_data, RETRIEVAL_COLUMN_FIELDS)
         ))
         conn.commit()
 
@@ -770,16 +902,11 @@ def store_retrieval(data: Dict) -> None:
 def store_llm_call(data: Dict) -> None:
     """Store an LLM call record."""
     llm_data = data.get('data', {})
-    frameworks = llm_data.get('frameworks')
-
-    # Get experiment_id BEFORE opening connection to avoid nested connections
-    if llm_data.get('experiment_name'):
-        experiment_id = get_or_create_experiment_by_name(llm_data['experiment_name'], frameworks)
-    else:
-        experiment_id = get_default_experiment_id()
 
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
+        experiment_id = _experiment_id_for(cursor, llm_data)
         cursor.execute("""
             INSERT INTO llm_calls
             (experiment_id, model, duration_ms, input_type, messages, prompt, response,
@@ -802,7 +929,7 @@ def store_llm_call(data: Dict) -> None:
             llm_data.get('error'),
             llm_data.get('trace_id'),
             llm_data.get('retrieval_id'),
-            json.dumps(llm_data)
+            _dump_payload(llm_data, LLM_COLUMN_FIELDS)
         ))
         conn.commit()
 
@@ -824,8 +951,8 @@ def get_traces(experiment_id: int = None, limit: int = 100) -> Dict[str, Dict]:
                 (limit,)
             )
         result = {}
-        for row in cursor.fetchall():
-            data = json.loads(row['data']) if row['data'] else dict(row)
+        for row in cursor:
+            data = _load_payload(row['data']) if row['data'] else dict(row)
             data['experiment_id'] = row['experiment_id']
             result[row['trace_id']] = data
         return result
@@ -846,7 +973,7 @@ def get_spans(trace_id: str = None, limit: int = 500) -> Dict[str, Dict]:
                 (limit,)
             )
         result = {}
-        for row in cursor.fetchall():
+        for row in cursor:
             result[row['span_id']] = {
                 'span_id': row['span_id'],
                 'trace_id': row['trace_id'],
@@ -857,8 +984,8 @@ def get_spans(trace_id: str = None, limit: int = 500) -> Dict[str, Dict]:
                 'end_time': row['end_time'],
                 'duration_ms': row['duration_ms'],
                 'status': row['status'],
-                'attributes': json.loads(row['attributes']) if row['attributes'] else {},
-                'events': json.loads(row['events']) if row['events'] else []
+                'attributes': _load_payload(row['attributes']) if row['attributes'] else {},
+                'events': _load_payload(row['events']) if row['events'] else []
             }
         return result
 
@@ -875,8 +1002,8 @@ def get_documents(experiment_id: int = None) -> Dict[str, Dict]:
         else:
             cursor.execute("SELECT * FROM documents ORDER BY created_at DESC")
         result = {}
-        for row in cursor.fetchall():
-            data = json.loads(row['data']) if row['data'] else dict(row)
+        for row in cursor:
+            data = _load_payload(row['data']) if row['data'] else dict(row)
             data['experiment_id'] = row['experiment_id']
             result[row['doc_id']] = data
         return result
@@ -888,8 +1015,10 @@ def get_parsed_docs() -> Dict[str, Dict]:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM parsed_docs ORDER BY created_at DESC")
         result = {}
-        for row in cursor.fetchall():
-            data = json.loads(row['data']) if row['data'] else dict(row)
+        for row in cursor:
+            data = _load_payload(row['data']) if row['data'] else dict(row)
+            if 'text' not in data and row['text'] is not None:
+                data['text'] = row['text']
             result[row['doc_id']] = data
         return result
 
@@ -912,9 +1041,11 @@ def get_chunks(doc_id: str = None, experiment_id: int = None, include_text: bool
         else:
             cursor.execute(f"SELECT * FROM chunks ORDER BY created_at DESC{limit_clause}")
         result = {}
-        for row in cursor.fetchall():
-            data = json.loads(row['data']) if row['data'] else dict(row)
+        for row in cursor:
+            data = _load_payload(row['data']) if row['data'] else dict(row)
             data['experiment_id'] = row['experiment_id']
+            if 'text' not in data and row['text'] is not None:
+                data['text'] = row['text']
             # Include character indices for precise chunk positioning (if available)
             if row['start_char_idx'] is not None:
                 data['start_char_idx'] = row['start_char_idx']
@@ -954,7 +1085,9 @@ def get_parsed_doc(doc_id: str) -> Dict:
         cursor.execute("SELECT * FROM parsed_docs WHERE doc_id = ?", (doc_id,))
         row = cursor.fetchone()
         if row:
-            data = json.loads(row['data']) if row['data'] else dict(row)
+            data = _load_payload(row['data']) if row['data'] else dict(row)
+            if 'text' not in data and row['text'] is not None:
+                data['text'] = row['text']
             return data
         return None
 
@@ -968,8 +1101,8 @@ def get_embeddings(limit: int = 100) -> List[Dict]:
             (limit,)
         )
         result = []
-        for row in cursor.fetchall():
-            data = json.loads(row['data']) if row['data'] else dict(row)
+        for row in cursor:
+            data = _load_payload(row['data']) if row['data'] else dict(row)
             result.append(data)
         return result
 
@@ -989,11 +1122,11 @@ def get_retrievals(experiment_id: int = None, limit: int = 100) -> List[Dict]:
                 (limit,)
             )
         result = []
-        for row in cursor.fetchall():
+        for row in cursor:
             # Parse data JSON if it exists
             if row['data']:
                 try:
-                    data = json.loads(row['data'])
+                    data = _load_payload(row['data'])
                 except (json.JSONDecodeError, TypeError):
                     data = {}
             else:
@@ -1007,7 +1140,7 @@ def get_retrievals(experiment_id: int = None, limit: int = 100) -> List[Dict]:
             if 'results' not in data or not isinstance(data.get('results'), list):
                 if row['results']:
                     try:
-                        data['results'] = json.loads(row['results'])
+                        data['results'] = _load_payload(row['results'])
                     except (json.JSONDecodeError, TypeError):
                         data['results'] = []
                 else:
@@ -1041,11 +1174,11 @@ def get_retrievals(experiment_id: int = None, limit: int = 100) -> List[Dict]:
                 if chunk_ids:
                     # Batch lookup chunks
                     placeholders = ','.join('?' * len(chunk_ids))
-                    cursor.execute(
+                    chunk_rows = conn.execute(
                         f"SELECT chunk_id, prev_anchor, next_anchor, html_start_idx, html_end_idx, page_number FROM chunks WHERE chunk_id IN ({placeholders})",
                         chunk_ids
                     )
-                    chunk_data = {r['chunk_id']: dict(r) for r in cursor.fetchall()}
+                    chunk_data = {r['chunk_id']: dict(r) for r in chunk_rows}
 
                     # Merge chunk data into results
                     for res in data['results']:
@@ -1082,11 +1215,11 @@ def get_llm_calls(experiment_id: int = None, limit: int = 100) -> List[Dict]:
                 (limit,)
             )
         result = []
-        for row in cursor.fetchall():
+        for row in cursor:
             # Parse data JSON if it exists
             if row['data']:
                 try:
-                    data = json.loads(row['data'])
+                    data = _load_payload(row['data'])
                 except (json.JSONDecodeError, TypeError):
                     data = {}
             else:
@@ -1100,7 +1233,7 @@ def get_llm_calls(experiment_id: int = None, limit: int = 100) -> List[Dict]:
             if 'messages' not in data or not isinstance(data.get('messages'), list):
                 if row['messages']:
                     try:
-                        data['messages'] = json.loads(row['messages'])
+                        data['messages'] = _load_payload(row['messages'])
                     except (json.JSONDecodeError, TypeError):
                         data['messages'] = None
                 else:
@@ -1137,40 +1270,33 @@ def get_stats(experiment_id: int = None) -> Dict:
     with get_db() as conn:
         cursor = conn.cursor()
 
+        # All counts in one single-row query
         if experiment_id:
-            cursor.execute("SELECT COUNT(*) FROM traces WHERE experiment_id = ?", (experiment_id,))
-            trace_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM spans WHERE trace_id IN (SELECT trace_id FROM traces WHERE experiment_id = ?)", (experiment_id,))
-            span_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM documents WHERE experiment_id = ?", (experiment_id,))
-            doc_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM parsed_docs WHERE doc_id IN (SELECT doc_id FROM documents WHERE experiment_id = ?)", (experiment_id,))
-            parsed_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM chunks WHERE experiment_id = ?", (experiment_id,))
-            chunk_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM embeddings WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE experiment_id = ?)", (experiment_id,))
-            emb_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM retrievals WHERE experiment_id = ?", (experiment_id,))
-            ret_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM llm_calls WHERE experiment_id = ?", (experiment_id,))
-            llm_count = cursor.fetchone()[0]
+            cursor.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM traces WHERE experiment_id = :exp),
+                    (SELECT COUNT(*) FROM spans WHERE trace_id IN (SELECT trace_id FROM traces WHERE experiment_id = :exp)),
+                    (SELECT COUNT(*) FROM documents WHERE experiment_id = :exp),
+                    (SELECT COUNT(*) FROM parsed_docs WHERE doc_id IN (SELECT doc_id FROM documents WHERE experiment_id = :exp)),
+                    (SELECT COUNT(*) FROM chunks WHERE experiment_id = :exp),
+                    (SELECT COUNT(*) FROM embeddings WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE experiment_id = :exp)),
+                    (SELECT COUNT(*) FROM retrievals WHERE experiment_id = :exp),
+                    (SELECT COUNT(*) FROM llm_calls WHERE experiment_id = :exp)
+            """, {"exp": experiment_id})
         else:
-            cursor.execute("SELECT COUNT(*) FROM traces")
-            trace_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM spans")
-            span_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM documents")
-            doc_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM parsed_docs")
-            parsed_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM chunks")
-            chunk_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM embeddings")
-            emb_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM retrievals")
-            ret_count = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM llm_calls")
-            llm_count = cursor.fetchone()[0]
+            cursor.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM traces),
+                    (SELECT COUNT(*) FROM spans),
+                    (SELECT COUNT(*) FROM documents),
+                    (SELECT COUNT(*) FROM parsed_docs),
+                    (SELECT COUNT(*) FROM chunks),
+                    (SELECT COUNT(*) FROM embeddings),
+                    (SELECT COUNT(*) FROM retrievals),
+                    (SELECT COUNT(*) FROM llm_calls)
+            """)
+        (trace_count, span_count, doc_count, parsed_count,
+         chunk_count, emb_count, ret_count, llm_count) = cursor.fetchone()
 
         return {
             "total_traces": trace_count,
@@ -1184,6 +1310,30 @@ def get_stats(experiment_id: int = None) -> Dict:
         }
 
 
+# Tables holding trace data; experiments, evaluations and categories are kept
+DATA_TABLES = (
+    'traces', 'spans', 'documents', 'parsed_docs', 'chunks', 'embeddings',
+    'retrievals', 'llm_calls', 'stage_chunks', 'pipeline_stages', 'pipelines',
+)
+_DELETE_DATA_SQL = "".join(f"DELETE FROM {table};\n" for table in DATA_TABLES)
+# Each runs as one transaction in a single executescript() call. A DELETE
+# without WHERE takes SQLite's truncate fast path (whole pages freed, no
+# per-row work) only while no DELETE trigger exists on these tables and none
+# is the parent of an enforced foreign key; keep it that way.
+_CLEAR_ALL_SCRIPT = f"BEGIN IMMEDIATE;\n{_DELETE_DATA_SQL}COMMIT;"
+_RESET_ALL_SCRIPT = f"""BEGIN IMMEDIATE;
+{_DELETE_DATA_SQL}DELETE FROM experiments WHERE name != 'Default';
+UPDATE experiments SET framework = NULL WHERE name = 'Default';
+COMMIT;"""
+
+# Tables with an experiment_id column
+EXPERIMENT_TABLES = ('traces', 'documents', 'chunks', 'retrievals', 'llm_calls')
+_UNASSIGN_EXPERIMENT_SQL = tuple(
+    f"UPDATE {table} SET experiment_id = NULL WHERE experiment_id = ?"
+    for table in EXPERIMENT_TABLES
+)
+
+
 def clear_all_data() -> None:
     """Clear all data from all tables (except experiments)."""
     global _default_experiment_id_cache
@@ -1193,31 +1343,16 @@ def clear_all_data() -> None:
     ensure_tables_exist()
 
     with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM traces")
-        cursor.execute("DELETE FROM spans")
-        cursor.execute("DELETE FROM documents")
-        cursor.execute("DELETE FROM parsed_docs")
-        cursor.execute("DELETE FROM chunks")
-        cursor.execute("DELETE FROM embeddings")
-        cursor.execute("DELETE FROM retrievals")
-        cursor.execute("DELETE FROM llm_calls")
-        cursor.execute("DELETE FROM stage_chunks")
-        cursor.execute("DELETE FROM pipeline_stages")
-        cursor.execute("DELETE FROM pipelines")
-        conn.commit()
+        conn.executescript(_CLEAR_ALL_SCRIPT)
 
 
 def clear_experiment_data(experiment_id: int) -> None:
     """Clear all data for a specific experiment."""
     with get_db() as conn:
-        cursor = conn.cursor()
+        _begin_write(conn)
         # Just unassign from experiment, don't delete
-        cursor.execute("UPDATE traces SET experiment_id = NULL WHERE experiment_id = ?", (experiment_id,))
-        cursor.execute("UPDATE documents SET experiment_id = NULL WHERE experiment_id = ?", (experiment_id,))
-        cursor.execute("UPDATE chunks SET experiment_id = NULL WHERE experiment_id = ?", (experiment_id,))
-        cursor.execute("UPDATE retrievals SET experiment_id = NULL WHERE experiment_id = ?", (experiment_id,))
-        cursor.execute("UPDATE llm_calls SET experiment_id = NULL WHERE experiment_id = ?", (experiment_id,))
+        for sql in _UNASSIGN_EXPERIMENT_SQL:
+            conn.execute(sql, (experiment_id,))
         conn.commit()
 
 
@@ -1230,24 +1365,7 @@ def reset_all_data() -> None:
     ensure_tables_exist()
 
     with get_db() as conn:
-        cursor = conn.cursor()
-        # Clear all data tables
-        cursor.execute("DELETE FROM traces")
-        cursor.execute("DELETE FROM spans")
-        cursor.execute("DELETE FROM documents")
-        cursor.execute("DELETE FROM parsed_docs")
-        cursor.execute("DELETE FROM chunks")
-        cursor.execute("DELETE FROM embeddings")
-        cursor.execute("DELETE FROM retrievals")
-        cursor.execute("DELETE FROM llm_calls")
-        cursor.execute("DELETE FROM stage_chunks")
-        cursor.execute("DELETE FROM pipeline_stages")
-        cursor.execute("DELETE FROM pipelines")
-        # Also clear experiments (except Default)
-        cursor.execute("DELETE FROM experiments WHERE name != 'Default'")
-        # Reset Default experiment's framework
-        cursor.execute("UPDATE experiments SET framework = NULL WHERE name = 'Default'")
-        conn.commit()
+        conn.executescript(_RESET_ALL_SCRIPT)
 
 
 # ========== Batch Operations ==========
@@ -1274,27 +1392,12 @@ def store_chunks_batch(chunks: list) -> None:
 
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
         for exp_name, chunk_list in by_experiment.items():
-            frameworks = list(frameworks_by_experiment.get(exp_name, set()))
-            framework_str = ','.join(sorted(frameworks)) if frameworks else None
-
             # Get experiment_id once per group
-            cursor.execute("SELECT id, framework FROM experiments WHERE name = ?", (exp_name,))
-            row = cursor.fetchone()
-            if row:
-                experiment_id = row['id']
-                # Update framework if needed - REPLACE don't combine
-                if frameworks and framework_str != (row['framework'] or ''):
-                    cursor.execute(
-                        "UPDATE experiments SET framework = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                        (framework_str, experiment_id)
-                    )
-            else:
-                cursor.execute(
-                    "INSERT INTO experiments (name, framework) VALUES (?, ?)",
-                    (exp_name, framework_str)
-                )
-                experiment_id = cursor.lastrowid
+            experiment_id = _get_or_create_experiment(
+                cursor, exp_name, list(frameworks_by_experiment.get(exp_name, set()))
+            )
 
             # Bulk insert all chunks for this experiment
             cursor.executemany("""
@@ -1318,7 +1421,7 @@ def store_chunks_batch(chunks: list) -> None:
                     c.get('next_anchor'),
                     json.dumps(c.get('metadata', {})),
                     c.get('trace_id'),
-                    json.dumps(c)
+                    _dump_payload(c, CHUNK_COLUMN_FIELDS)
                 ) for c in chunk_list
             ])
         conn.commit()
@@ -1345,23 +1448,12 @@ def store_documents_batch(documents: list) -> None:
 
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
         for exp_name, doc_list in by_experiment.items():
-            frameworks = list(frameworks_by_experiment.get(exp_name, set()))
-            framework_str = ','.join(sorted(frameworks)) if frameworks else None
-
-            cursor.execute("SELECT id, framework FROM experiments WHERE name = ?", (exp_name,))
-            row = cursor.fetchone()
-            if row:
-                experiment_id = row['id']
-                # Update framework if needed - REPLACE don't combine
-                if frameworks and framework_str != (row['framework'] or ''):
-                    cursor.execute(
-                        "UPDATE experiments SET framework = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                        (framework_str, experiment_id)
-                    )
-            else:
-                cursor.execute("INSERT INTO experiments (name, framework) VALUES (?, ?)", (exp_name, framework_str))
-                experiment_id = cursor.lastrowid
+            # Get experiment_id once per group
+            experiment_id = _get_or_create_experiment(
+                cursor, exp_name, list(frameworks_by_experiment.get(exp_name, set()))
+            )
 
             cursor.executemany("""
                 INSERT OR REPLACE INTO documents
@@ -1376,7 +1468,7 @@ def store_documents_batch(documents: list) -> None:
                     d.get('num_pages'),
                     d.get('text_length'),
                     d.get('trace_id'),
-                    json.dumps(d)
+                    _dump_payload(d)
                 ) for d in doc_list
             ])
         conn.commit()
@@ -1403,27 +1495,83 @@ def store_parsed_batch(parsed_docs: list) -> None:
                 d.get('text'),
                 len(d.get('text', '')) if d.get('text') else 0,
                 d.get('trace_id'),
-                json.dumps(d)
+                _dump_payload(d, PARSED_COLUMN_FIELDS)
             ) for d in doc_list
         ])
         conn.commit()
 
 
+
+def store_spans_batch(spans: list) -> None:
+    """Store multiple span events in a single transaction.
+
+    Events are applied in order, so a span_end replaces its span_start.
+    """
+    if not spans:
+        return
+
+    span_list = [span.get('data', {}) for span in spans]
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT OR REPLACE INTO spans
+            (span_id, trace_id, parent_id, name, kind, start_time, end_time, duration_ms, status, attributes, events)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (
+                s.get('span_id'),
+                s.get('trace_id'),
+                s.get('parent_id'),
+                s.get('name'),
+                s.get('kind'),
+                s.get('start_time'),
+                s.get('end_time'),
+                s.get('duration_ms'),
+                s.get('status'),
+                _dump_payload(s['attributes']) if s.get('attributes') else None,
+                _dump_payload(s['events']) if s.get('events') else None
+            ) for s in span_list
+        ])
+        conn.commit()
+
+
+def store_embeddings_batch(embeddings: list) -> None:
+    """Store multiple embedding records in a single transaction."""
+    if not embeddings:
+        return
+
+    emb_list = [emb.get('data', {}) for emb in embeddings]
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO embeddings
+            (chunk_id, model, dimensions, duration_ms, trace_id, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [
+            (
+                e.get('chunk_id'),
+                e.get('model'),
+                e.get('dimensions'),
+                e.get('duration_ms'),
+                e.get('trace_id'),
+                _dump_payload(e)
+            ) for e in emb_list
+        ])
+        conn.commit()
+
+
 # ========== Pipeline Functions ==========
 
 def store_pipeline(data: Dict) -> None:
     """Store a pipeline record."""
     pipeline_data = data.get('data', {})
-    frameworks = pipeline_data.get('frameworks')
-
-    # Get experiment_id
-    if pipeline_data.get('experiment_name'):
-        experiment_id = get_or_create_experiment_by_name(pipeline_data['experiment_name'], frameworks)
-    else:
-        experiment_id = get_default_experiment_id()
 
     with get_db() as conn:
         cursor = conn.cursor()
+        _begin_write(conn)
+        experiment_id = _experiment_id_for(cursor, pipeline_data)
         cursor.execute("""
             INSERT OR REPLACE INTO pipelines
             (pipeline_id, experiment_id, query, total_duration_ms, num_stages, retrieval_id, llm_call_id)
@@ -1675,7 +1823,7 @@ def get_evaluations(
         )
 
         results = []
-        for row in cursor.fetchall():
+        for row in cursor:
             result = dict(row)
             result['metadata'] = json.loads(result['metadata']) if result['metadata'] else {}
             results.append(result)
@@ -1735,7 +1883,7 @@ def get_query_categories(retrieval_id: Optional[str] = None) -> List[Dict]:
             cursor.execute("SELECT * FROM query_categories ORDER BY created_at DESC")
 
         results = []
-        for row in cursor.fetchall():
+        for row in cursor:
             result = dict(row)
             result['metadata'] = json.loads(result['metadata']) if result['metadata'] else {}
             results.append(result)
@@ -3,6 +3,7 @@ Trace storage - stores traces locally and sends to SourcemapR platform.
 """
 
 import json
+import os
 import threading
 import queue
 import requests
@@ -13,6 +14,14 @@ from dataclasses import dataclass, field
 import uuid
 
 
+# Per-event progress output is off by default; set SOURCEMAPR_DEBUG=1 to enable it
+_DEBUG = bool(os.environ.get("SOURCEMAPR_DEBUG"))
+
+# Upper bound on queued send items; beyond it new events are dropped (and
+# counted) rather than blocking the instrumented application
+MAX_QUEUED_EVENTS = 10000
+
+
 @dataclass
 class Span:
     """A single span in a trace."""
@@ -71,6 +80,13 @@ class TraceStore:
     - In-memory storage for current session
     - Async sending to platform endpoint
     - Local file backup
+
+    Set ``enabled = False`` to pause tracing without uninstrumenting; patched
+    methods and callbacks check it first and fall straight through to the
+    original call. Setting SOURCEMAPR_DISABLED=1 starts the store paused.
+
+    Events are queued for the sender thread without ever blocking; if the
+    queue is full they are dropped and counted in ``dropped_events``.
     """
 
     def __init__(self, endpoint: Optional[str] = None, local_path: str = "./traces", experiment: Optional[str] = None):
@@ -79,6 +95,8 @@ class TraceStore:
         self.local_path.mkdir(exist_ok=True)
         self.experiment = experiment  # Experiment name for auto-assignment
         self.frameworks: set = set()  # Track which frameworks are being used
+        # Instrumentation is skipped entirely while False
+        self.enabled = not os.environ.get("SOURCEMAPR_DISABLED")
 
         # Storage
         self.traces: Dict[str, Trace] = {}
@@ -91,9 +109,11 @@ class TraceStore:
         self._retrieval_lock = threading.Lock()
 
         # Async sending
-        self._send_queue: queue.Queue = queue.Queue()
+        self._send_queue: queue.Queue = queue.Queue(maxsize=MAX_QUEUED_EVENTS)
         self._sender_thread: Optional[threading.Thread] = None
         self._running = False
+        self.dropped_events = 0
+        self._dropped_lock = threading.Lock()
 
         if endpoint:
             self._start_sender()
@@ -104,10 +124,20 @@ class TraceStore:
         self._sender_thread = threading.Thread(target=self._sender_loop, daemon=True)
         self._sender_thread.start()
 
+    def _enqueue(self, item: Dict) -> bool:
+        """Queue an item for the sender thread, dropping it if the queue is full."""
+        try:
+            self._send_queue.put_nowait(item)
+            return True
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped_events += 1
+            return False
+
     def _sender_loop(self):
         """Background loop to send traces to endpoint with batching."""
         BATCH_SIZE = 200  # Batch up to 200 items at a time for efficiency
-        BATCH_TYPES = {'chunk', 'embedding', 'document', 'parsed'}  # Types that can be batched
+        BATCH_TYPES = {'chunk', 'embedding', 'document', 'parsed', 'span_start', 'span_end'}  # Types that can be batched
 
         batch = []
 
@@ -118,7 +148,8 @@ class TraceStore:
             if len(batch) == 1:
                 self._send_to_endpoint(batch[0])
             else:
-                self._send_batch(batch)
+                for start in range(0, len(batch), BATCH_SIZE):
+                    self._send_batch(batch[start:start + BATCH_SIZE])
             batch = []
 
         while True:
@@ -131,7 +162,9 @@ class TraceStore:
                     remaining_items = []
                     while not self._send_queue.empty():
                         remaining = self._send_queue.get_nowait()
-                        if remaining:
+                        if remaining and remaining.get('type') == 'batch':
+                            remaining_items.extend(remaining['items'])
+                        elif remaining:
                             remaining_items.append(remaining)
                     if remaining_items:
                         self._send_batch(remaining_items)
@@ -139,18 +172,23 @@ class TraceStore:
 
                 event_type = item.get('type', 'unknown')
 
+                # Pre-grouped events from a bulk log call (one queue put for many events)
+                if event_type == 'batch':
+                    batch.extend(item['items'])
+                    if len(batch) >= BATCH_SIZE:
+                        flush_batch()
                 # Batch certain types together
-                if event_type in BATCH_TYPES:
+                elif event_type in BATCH_TYPES:
                     batch.append(item)
                     if len(batch) >= BATCH_SIZE:
                         flush_batch()
                 else:
                     # Flush batch before sending non-batchable item
                     flush_batch()
-                    if event_type == 'retrieval':
+                    if _DEBUG and event_type == 'retrieval':
                         print(f"[SourcemapR] Sender: sending retrieval...")
                     self._send_to_endpoint(item)
-                    if event_type == 'retrieval':
+                    if _DEBUG and event_type == 'retrieval':
                         print(f"[SourcemapR] Sender: retrieval sent!")
 
             except queue.Empty:
@@ -219,7 +257,7 @@ class TraceStore:
         if self.current_trace:
             self.current_trace.end_time = datetime.now()
             # Send to platform
-            self._send_queue.put({"type": "trace", "data": self.current_trace.to_dict()})
+            self._enqueue({"type": "trace", "data": self.current_trace.to_dict()})
             # Save locally
             self._save_local(self.current_trace)
             self.current_trace = None
@@ -242,7 +280,7 @@ class TraceStore:
         self.span_stack.append(span)
 
         # Send span start event
-        self._send_queue.put({"type": "span_start", "data": span.to_dict()})
+        self._enqueue({"type": "span_start", "data": span.to_dict()})
 
         return span
 
@@ -261,7 +299,7 @@ class TraceStore:
                 span.attributes.update(attributes)
 
             # Send span end event
-            self._send_queue.put({"type": "span_end", "data": span.to_dict()})
+            self._enqueue({"type": "span_end", "data": span.to_dict()})
 
     def add_event(self, name: str, attributes: Dict = None):
         """Add an event to the current span."""
@@ -274,7 +312,7 @@ class TraceStore:
 
     def log_document(self, doc_id: str, filename: str, **kwargs):
         """Log a document being processed."""
-        self._send_queue.put({
+        self._enqueue({
             "type": "document",
             "data": {
                 "doc_id": doc_id,
@@ -286,7 +324,7 @@ class TraceStore:
 
     def log_parsed(self, doc_id: str, filename: str, text: str, **kwargs):
         """Log parsed document content."""
-        self._send_queue.put({
+        self._enqueue({
             "type": "parsed",
             "data": {
                 "doc_id": doc_id,
@@ -298,9 +336,10 @@ class TraceStore:
             }
         })
 
-    def log_chunk(self, chunk_id: str, doc_id: str, index: int, text: str, **kwargs):
-        """Log a chunk being created."""
-        self._send_queue.put({
+    def _chunk_event(self, chunk_id: str, doc_id: str, index: int, text: str,
+                     trace_id: Optional[str], **kwargs) -> Dict:
+        """Build the queue event for a single chunk."""
+        return {
             "type": "chunk",
             "data": {
                 "chunk_id": chunk_id,
@@ -308,14 +347,45 @@ class TraceStore:
                 "index": index,
                 "text": text[:500],
                 "text_length": len(text),
-                "trace_id": self.current_trace.trace_id if self.current_trace else None,
+                "trace_id": trace_id,
                 **kwargs
             }
-        })
+        }
+
+    def log_chunk(self, chunk_id: str, doc_id: str, index: int, text: str, **kwargs):
+        """Log a chunk being created."""
+        trace_id = self.current_trace.trace_id if self.current_trace else None
+        self._enqueue(self._chunk_event(chunk_id, doc_id, index, text, trace_id, **kwargs))
+
+    def log_chunks_bulk(self, chunks: List[Dict]):
+        """Log many chunks with a single queue put.
+
+        Each dict holds the keyword arguments of :meth:`log_chunk`. A chunk's
+        ``metadata`` dict is copied here, with its ``file_path`` added, since
+        callers may change the original before the sender thread sends it.
+        """
+        if not chunks:
+            return
+        trace_id = self.current_trace.trace_id if self.current_trace else None
+        # Same payload as _chunk_event, built inline to skip a call and
+        # keyword unpacking per chunk
+        items = []
+        for chunk in chunks:
+            data = {
+                **chunk,
+                "text": chunk["text"][:500],
+                "text_length": len(chunk["text"]),
+                "trace_id": trace_id,
+            }
+            metadata = chunk.get("metadata")
+            if metadata is not None:
+                data["metadata"] = {**metadata, "file_path": chunk.get("file_path")}
+            items.append({"type": "chunk", "data": data})
+        self._enqueue({"type": "batch", "items": items})
 
     def log_embedding(self, chunk_id: str, model: str, dim: int, duration_ms: float):
         """Log an embedding being created."""
-        self._send_queue.put({
+        self._enqueue({
             "type": "embedding",
             "data": {
                 "chunk_id": chunk_id,
@@ -326,8 +396,9 @@ class TraceStore:
             }
         })
 
-    def log_retrieval(self, query: str, results: List[Dict], duration_ms: float, response: str = None, retrieval_id: str = None):
-        """Log a retrieval operation."""
+    def _retrieval_event(self, query: str, results: List[Dict], duration_ms: float,
+                         response: str = None, retrieval_id: str = None) -> Dict:
+        """Build a retrieval event, generating (and queueing) an id if none is given."""
         # Use provided retrieval_id or generate a new one
         if retrieval_id is None:
             retrieval_id = str(uuid.uuid4())[:12]
@@ -335,7 +406,7 @@ class TraceStore:
             with self._retrieval_lock:
                 self._retrieval_id_queue.append(retrieval_id)
 
-        data = {
+        return {
             "type": "retrieval",
             "data": {
                 "query": query,
@@ -348,9 +419,24 @@ class TraceStore:
                 "retrieval_id": retrieval_id  # Unique ID to link with LLM call
             }
         }
-        print(f"[SourcemapR] Sending retrieval: {query[:30]}...")
+
+    def log_retrieval(self, query: str, results: List[Dict], duration_ms: float, response: str = None, retrieval_id: str = None):
+        """Log a retrieval operation."""
+        data = self._retrieval_event(query, results, duration_ms, response, retrieval_id)
+        if _DEBUG:
+            print(f"[SourcemapR] Sending retrieval: {query[:30]}...")
         self._send_to_endpoint(data)
-        print(f"[SourcemapR] Retrieval sent!")
+        if _DEBUG:
+            print(f"[SourcemapR] Retrieval sent!")
+
+    def log_retrieval_deferred(self, query: str, results: List[Dict], duration_ms: float,
+                               batch: List[Dict], response: str = None, retrieval_id: str = None):
+        """Append a retrieval event to ``batch`` instead of sending it.
+
+        The caller queues ``batch`` itself, so the retrieval travels in the
+        same send as the pipeline events it belongs to.
+        """
+        batch.append(self._retrieval_event(query, results, duration_ms, response, retrieval_id))
 
     def log_llm(
         self,
@@ -440,12 +526,14 @@ class TraceStore:
         # Any additional kwargs
         data.update(kwargs)
 
-        print(f"[SourcemapR] Sending LLM call: {model}...")
+        if _DEBUG:
+            print(f"[SourcemapR] Sending LLM call: {model}...")
         self._send_to_endpoint({
             "type": "llm",
             "data": data
         })
-        print(f"[SourcemapR] LLM call sent!")
+        if _DEBUG:
+            print(f"[SourcemapR] LLM call sent!")
 
     def _save_local(self, trace: Trace):
         """Save trace to local file."""
@@ -466,8 +554,9 @@ class TraceStore:
         if queue_size > 0:
             print(f"[SourcemapR] Flushing {queue_size} remaining events...")
 
-        self._send_queue.put(None)
         if self._sender_thread:
+            # Blocking put: the sentinel must get in even if the queue is full
+            self._send_queue.put(None)
             # Wait longer for large queues (60 seconds max)
             timeout = min(60.0, max(10.0, queue_size * 0.05))
             self._sender_thread.join(timeout=timeout)
@@ -476,3 +565,6 @@ class TraceStore:
             remaining = self._send_queue.qsize()
             if remaining > 0:
                 print(f"[SourcemapR] Warning: {remaining} events may not have been sent (timeout)")
+
+        if self.dropped_events:
+            print(f"[SourcemapR] Warning: {self.dropped_events} events were dropped (send queue full)")
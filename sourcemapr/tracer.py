@@ -91,6 +91,14 @@ class Tracer:
         finally:
             self.store.end_trace()
 
+    def pause(self):
+        """Skip instrumentation without removing hooks."""
+        self.store.enabled = False
+
+    def resume(self):
+        """Resume instrumentation after pause()."""
+        self.store.enabled = True
+
     def stop(self):
         """Stop the tracer and flush pending data."""
         self.store.stop()
@@ -131,6 +139,23 @@ def stop_tracing():
         _tracer = None
 
 
+def pause_tracing():
+    """
+    Pause tracing; patched calls go straight to the original code.
+
+    Useful for timing runs without instrumentation overhead. Start with
+    SOURCEMAPR_DISABLED=1 to begin paused.
+    """
+    if _tracer:
+        _tracer.pause()
+
+
+def resume_tracing():
+    """Resume tracing after pause_tracing()."""
+    if _tracer:
+        _tracer.resume()
+
+
 def get_tracer() -> Optional[Tracer]:
     """Get the current tracer instance."""
     return _tracer
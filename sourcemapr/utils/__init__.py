@@ -2,10 +2,13 @@
 
 from sourcemapr.utils.html_parser import (
     HTMLParser,
+    build_page_lookup,
     extract_text_with_pages,
     get_page_for_position,
+    scale_page_positions,
 )
 from sourcemapr.utils.html_text_extractor import (
+    HTMLChunkLocator,
     PositionTrackingExtractor,
     extract_with_positions,
     get_html_positions_for_chunk,
@@ -18,8 +21,11 @@ from sourcemapr.utils.html_position_mapper import (
 
 __all__ = [
     "HTMLParser",
+    "build_page_lookup",
     "extract_text_with_pages",
     "get_page_for_position",
+    "scale_page_positions",
+    "HTMLChunkLocator",
     "PositionTrackingExtractor",
     "extract_with_positions",
     "get_html_positions_for_chunk",
@@ -10,7 +10,8 @@ Works with any HTML file, including SEC EDGAR filings.
 """
 
 import re
-from typing import Dict, List, Optional, Tuple
+from bisect import bisect_right
+from typing import Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
 
@@ -27,6 +28,9 @@ PAGE_BREAK_PATTERNS = [
 # Page break marker for text extraction
 PAGE_BREAK_MARKER = "\n\n--- PAGE BREAK ---\n\n"
 
+# Lower-cased suffixes handled by the HTML page/position mapping
+HTML_EXTENSIONS = ('.htm', '.html', '.xhtml')
+
 
 @dataclass
 class HTMLPage:
@@ -306,3 +310,72 @@ def get_page_for_position(
     if page_positions:
         return max(page_positions.keys())
     return 1
+
+
+def build_page_lookup(
+    page_positions: Dict[int, Tuple[int, int]]
+) -> Callable[[int], int]:
+    """
+    Build a position -> page function for repeated lookups in one mapping.
+
+    Gives the same answers as get_page_for_position, but when the page
+    ranges are ordered and non-overlapping (as produced by HTMLParser and
+    scale_page_positions) each lookup is a binary search instead of a sort
+    and scan.
+
+    Args:
+        page_positions: Mapping of page_num -> (start, end)
+
+    Returns:
+        Function mapping a character position to a page number (1-indexed)
+    """
+    if not page_positions:
+        return lambda position: 1
+
+    pages = sorted(page_positions)
+    starts = [page_positions[page][0] for page in pages]
+    ends = [page_positions[page][1] for page in pages]
+    ordered = all(start <= end for start, end in zip(starts, ends)) and all(
+        end <= next_start for end, next_start in zip(ends, starts[1:])
+    )
+    if not ordered:
+        return lambda position: get_page_for_position(position, page_positions)
+
+    last_page = pages[-1]
+
+    def lookup(position: int) -> int:
+        i = bisect_right(starts, position) - 1
+        if i >= 0 and position < ends[i]:
+            return pages[i]
+        # Return last page if beyond end (or between pages)
+        return last_page
+
+    return lookup
+
+
+def scale_page_positions(
+    page_positions: Dict[int, Tuple[int, int]],
+    source_len: int,
+    target_len: int
+) -> Dict[int, Tuple[int, int]]:
+    """
+    Scale page positions from one text length onto another.
+
+    Used to project page boundaries found in the parser's extracted text
+    onto the (differently sized) text produced by a framework loader.
+
+    Args:
+        page_positions: Mapping of page_num -> (start, end) in the source text
+        source_len: Length of the text the positions were computed against
+        target_len: Length of the text to project the positions onto
+
+    Returns:
+        Mapping of page_num -> (start, end) in the target text
+    """
+    if source_len <= 0:
+        return {1: (0, target_len)}
+    scale = target_len / source_len
+    return {
+        page_num: (int(start * scale), int(end * scale))
+        for page_num, (start, end) in page_positions.items()
+    }
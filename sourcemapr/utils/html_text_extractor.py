@@ -8,6 +8,7 @@ This enables accurate highlighting in the Original HTML view.
 """
 
 import re
+from collections import OrderedDict
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
 
@@ -265,8 +266,13 @@ def find_text_in_html(html_content: str, search_text: str, start_from: int = 0)
     """
     if not search_text or len(search_text) < 20:
         return None
+    return _find_text_in_lowered_html(html_content.lower(), search_text, start_from)
 
-    import re
+
+def _find_text_in_lowered_html(html_lower: str, search_text: str, start_from: int = 0) -> Optional[int]:
+    """find_text_in_html against HTML that has already been lower-cased."""
+    if not search_text or len(search_text) < 20:
+        return None
 
     # Extract distinctive words from search text (4+ chars for distinctiveness)
     search_words = [w.lower() for w in re.findall(r'[a-zA-Z]{4,}', search_text)]
@@ -277,8 +283,6 @@ def find_text_in_html(html_content: str, search_text: str, start_from: int = 0)
     search_words = search_words[:8]
 
     # Find word positions in visible text only (skip tag contents)
-    html_lower = html_content.lower()
-
     def find_word_outside_tags(word, start):
         """Find word position only in visible text, not inside < >"""
         pos = start
@@ -332,6 +336,104 @@ def find_text_in_html(html_content: str, search_text: str, start_from: int = 0)
     return None
 
 
+class HTMLChunkLocator:
+    """
+    Locates chunks of loader text in one raw HTML document.
+
+    The HTML is lower-cased once and recent searches are remembered, so
+    mapping all chunks of a document (each chunk's text is searched again as
+    its neighbours' prev/next context) costs one scan per distinct text rather
+    than up to three full-document copies and scans per chunk.
+    """
+
+    # Searches remembered per document; repeats come from neighbouring chunks,
+    # so only the most recent ones are worth keeping
+    MAX_REMEMBERED_SEARCHES = 1024
+
+    def __init__(self, html_content: str):
+        self.html_content = html_content
+        self._html_lower = html_content.lower()
+        self._found: 'OrderedDict[Tuple[str, int], Optional[int]]' = OrderedDict()
+
+    def find_text(self, search_text: str, start_from: int = 0) -> Optional[int]:
+        """Same as find_text_in_html, against this document."""
+        key = (search_text, start_from)
+        found = self._found
+        if key in found:
+            found.move_to_end(key)
+            return found[key]
+        pos = found[key] = _find_text_in_lowered_html(self._html_lower, search_text, start_from)
+        if len(found) > self.MAX_REMEMBERED_SEARCHES:
+            found.popitem(last=False)
+        return pos
+
+    def get_positions(
+        self,
+        loader_text: str,
+        chunk_start: int,
+        chunk_end: int,
+        chunk_text: str = None,
+        prev_chunk_text: str = None,
+        next_chunk_text: str = None
+    ) -> Tuple[int, int]:
+        """Same as get_html_positions_for_chunk, against this document."""
+        html_content = self.html_content
+
+        # Get chunk text if not provided
+        if chunk_text is None:
+            chunk_text = loader_text[chunk_start:chunk_end]
+
+        chunk_len = len(chunk_text)
+
+        # Strategy 1: Direct text search
+        html_start = self.find_text(chunk_text)
+        if html_start is not None:
+            # Estimate end position (may span more HTML due to tags)
+            html_end = html_start + chunk_len * 2  # Rough estimate
+            return html_start, min(html_end, len(html_content))
+
+        # Strategy 2: Find surrounding chunks and interpolate
+        prev_pos = None
+        next_pos = None
+
+        if prev_chunk_text:
+            prev_pos = self.find_text(prev_chunk_text)
+
+        if next_chunk_text:
+            # Search after prev_pos if we found it
+            search_from = prev_pos + len(prev_chunk_text) if prev_pos else 0
+            next_pos = self.find_text(next_chunk_text, search_from)
+
+        if prev_pos is not None and next_pos is not None:
+            # Chunk is between prev and next
+            html_start = prev_pos + len(prev_chunk_text)
+            html_end = next_pos
+            return html_start, html_end
+
+        if prev_pos is not None:
+            # Chunk starts after prev
+            html_start = prev_pos + len(prev_chunk_text)
+            html_end = html_start + chunk_len * 2
+            return html_start, min(html_end, len(html_content))
+
+        if next_pos is not None:
+            # Chunk ends before next
+            html_end = next_pos
+            html_start = max(0, html_end - chunk_len * 2)
+            return html_start, html_end
+
+        # Strategy 3: Ratio-based fallback (last resort)
+        # Estimate based on position in loader text
+        if len(loader_text) > 0:
+            ratio = chunk_start / len(loader_text)
+            html_start = int(ratio * len(html_content))
+            html_end = html_start + chunk_len * 2
+            return html_start, min(html_end, len(html_content))
+
+        # Ultimate fallback
+        return chunk_start, chunk_end
+
+
 def get_html_positions_for_chunk(
     html_content: str,
     loader_text: str,
@@ -349,6 +451,9 @@ def get_html_positions_for_chunk(
     2. If not found, find surrounding chunks and interpolate position
     3. Fall back to approximate position based on document structure
 
+    When mapping many chunks of the same document, use one HTMLChunkLocator
+    instead so the HTML is prepared once.
+
     Args:
         html_content: Raw HTML content
         loader_text: Text as extracted by loader
@@ -361,56 +466,9 @@ def get_html_positions_for_chunk(
     Returns:
         Tuple of (html_start, html_end)
     """
-    # Get chunk text if not provided
-    if chunk_text is None:
-        chunk_text = loader_text[chunk_start:chunk_end]
-
-    chunk_len = len(chunk_text)
-
-    # Strategy 1: Direct text search
-    html_start = find_text_in_html(html_content, chunk_text)
-    if html_start is not None:
-        # Estimate end position (may span more HTML due to tags)
-        html_end = html_start + chunk_len * 2  # Rough estimate
-        return html_start, min(html_end, len(html_content))
-
-    # Strategy 2: Find surrounding chunks and interpolate
-    prev_pos = None
-    next_pos = None
-
-    if prev_chunk_text:
-        prev_pos = find_text_in_html(html_content, prev_chunk_text)
-
-    if next_chunk_text:
-        # Search after prev_pos if we found it
-        search_from = prev_pos + len(prev_chunk_text) if prev_pos else 0
-        next_pos = find_text_in_html(html_content, next_chunk_text, search_from)
-
-    if prev_pos is not None and next_pos is not None:
-        # Chunk is between prev and next
-        html_start = prev_pos + len(prev_chunk_text)
-        html_end = next_pos
-        return html_start, html_end
-
-    if prev_pos is not None:
-        # Chunk starts after prev
-        html_start = prev_pos + len(prev_chunk_text)
-        html_end = html_start + chunk_len * 2
-        return html_start, min(html_end, len(html_content))
-
-    if next_pos is not None:
-        # Chunk ends before next
-        html_end = next_pos
-        html_start = max(0, html_end - chunk_len * 2)
-        return html_start, html_end
-
-    # Strategy 3: Ratio-based fallback (last resort)
-    # Estimate based on position in loader text
-    if len(loader_text) > 0:
-        ratio = chunk_start / len(loader_text)
-        html_start = int(ratio * len(html_content))
-        html_end = html_start + chunk_len * 2
-        return html_start, min(html_end, len(html_content))
-
-    # Ultimate fallback
-    return chunk_start, chunk_end
+    return HTMLChunkLocator(html_content).get_positions(
+        loader_text, chunk_start, chunk_end,
+        chunk_text=chunk_text,
+        prev_chunk_text=prev_chunk_text,
+        next_chunk_text=next_chunk_text,
+    )